@@ -65,11 +65,25 @@ maybe_python_deps() {
   fi
 }
 
+# Cambios que un reload no recoge (el proceso maestro o la unidad en sí)
+RESTART_PATHS="${RESTART_PATHS:-server/scripts/run.sh server/service server/requirements.txt}"
+
 restart_services() {
+  local before="$1" after="$2" mode="reload"
+  if [[ -n "$(cd "$REPO_DIR" && git diff --name-only "$before" "$after" -- $RESTART_PATHS 2>/dev/null)" ]]; then
+    mode="restart"
+  fi
   if [[ -n "$SERVICES" ]]; then
     for s in $SERVICES; do
-      log "Reiniciando $s (try-restart)…"
-      sudo /bin/systemctl try-restart "$s" || true
+      if [[ "$mode" == "reload" ]]; then
+        # Con ExecReload (toggle.service) recarga sin cortar clientes; si la
+        # unidad no lo soporta, systemd hace un try-restart como antes
+        log "Recargando $s (try-reload-or-restart)…"
+        sudo /bin/systemctl try-reload-or-restart "$s" || true
+      else
+        log "Reiniciando $s (try-restart)…"
+        sudo /bin/systemctl try-restart "$s" || true
+      fi
     done
   else
     log "No hay servicios definidos en SERVICES. Nada que reiniciar."
@@ -89,7 +103,7 @@ main() {
   if [[ "$before" != "$after" ]]; then
     log "Cambios detectados: $before -> $after"
     maybe_python_deps
-    restart_services
+    restart_services "$before" "$after"
   else
     log "Sin cambios."
     # Opcional: instalar deps aunque no haya commits nuevos
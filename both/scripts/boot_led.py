@@ -1,14 +1,17 @@
 #!/usr/bin/env python3
-import RPi.GPIO as GPIO
 import time
 import subprocess
 import signal
 import sys
 
+from gpio_manager import GpioManager
+
 # Configuración
 LED_PIN = 13           # numeración física (BOARD): pin 13
 BLINK_INTERVAL = 0.25  # segundos entre cambios durante el arranque
 
+gpio = None
+
 def system_is_ready() -> bool:
     """
     Devuelve True cuando systemd reporta que el sistema está 'running' (o 'degraded').
@@ -28,29 +31,27 @@ def system_is_ready() -> bool:
 def sigterm_handler(signum, frame):
     # Si nos paran antes de terminar, apagamos y limpiamos
     try:
-        GPIO.output(LED_PIN, GPIO.LOW)
-        GPIO.cleanup()
+        if gpio is not None:
+            gpio.close()
     finally:
         sys.exit(0)
 
 def main():
-    GPIO.setwarnings(False)
-    GPIO.setmode(GPIO.BOARD)
-    GPIO.setup(LED_PIN, GPIO.OUT, initial=GPIO.LOW)
+    global gpio
+    gpio = GpioManager()
+    gpio.setup_output(LED_PIN)
 
     signal.signal(signal.SIGTERM, sigterm_handler)
     signal.signal(signal.SIGINT, sigterm_handler)
 
-    led_on = False
-
-    # Parpadea mientras el sistema no está listo
+    # Parpadea (en el hilo del gestor) mientras el sistema no está listo;
+    # así el ritmo no depende de lo que tarde systemctl en responder
+    gpio.blink(LED_PIN, BLINK_INTERVAL)
     while not system_is_ready():
-        led_on = not led_on
-        GPIO.output(LED_PIN, GPIO.HIGH if led_on else GPIO.LOW)
         time.sleep(BLINK_INTERVAL)
 
     # Sistema listo: LED fijo encendido 
-    GPIO.output(LED_PIN, GPIO.HIGH)
+    gpio.set(LED_PIN, True, now=True)
 
     # Señal de "boot listo" para systemd.path
     try:
@@ -59,7 +60,8 @@ def main():
     except Exception:
         pass
 
-    # No llamamos a  GPIO.cleanup() para mantener el LED encendido
+    # Sin cleanup para mantener el LED encendido
+    gpio.close(cleanup=False)
 
 if __name__ == "__main__":
     main()
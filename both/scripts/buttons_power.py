@@ -1,11 +1,12 @@
 #!/usr/bin/env python3
 import time, subprocess, sys
-import RPi.GPIO as GPIO
+
+from gpio_manager import GpioManager
 
 # --- Config ---
 BTN_REBOOT   = 11  # BOARD 11 (BCM17)
 BTN_SHUTDOWN = 15  # BOARD 15 (BCM22)
-ACTIVE_LEVEL = GPIO.LOW
+ACTIVE_LEVEL = 0   # a GND = pulsado
 DEBOUNCE_SEC = 0.05
 CHECK_INTERVAL = 0.01
 THRESHOLD_SEC = 1.00
@@ -18,6 +19,8 @@ SAFE_LOW_PINS = [13, 16, 18, 29]  # boot LED, internet LED, server LED → ajust
 # Servicios que podrían tocar esos pines (pararlos antes de forzar LOW)
 SAFE_SERVICES = ["boot-led.service", "internet-led.path", "internet-led.service", "server-led.service", "server-online-led.service"]
 
+gpio = None
+
 def quiesce_services():
     # Para evitar que vuelvan a escribir en los GPIO tras nuestro "force low"
     import subprocess, time
@@ -35,14 +38,10 @@ def quiesce_services():
     time.sleep(0.05)
 
 def force_all_low():
-    import RPi.GPIO as GPIO
     try:
-        GPIO.setwarnings(False)
-        GPIO.setmode(GPIO.BOARD)
         for p in SAFE_LOW_PINS:
             try:
-                GPIO.setup(p, GPIO.OUT, initial=GPIO.LOW)
-                GPIO.output(p, GPIO.LOW)
+                gpio.setup_output(p, False)  # el setup ya conduce el pin a LOW
             except Exception as e:
                 print(f"[SAFE-LOW] pin {p}: {e}")
         print("[SAFE-LOW] all forced LOW")
@@ -63,14 +62,14 @@ def do_shutdown():
     if not DRY_RUN:
         subprocess.Popen(["/bin/systemctl", "poweroff", "-i"])
 
-def pressed(pin): return GPIO.input(pin) == ACTIVE_LEVEL
+def pressed(pin): return gpio.read(pin) == ACTIVE_LEVEL
 
 def main():
+    global gpio
     print("[BOOT] buttons_power hold-to-act starting…")
-    GPIO.setwarnings(False)
-    GPIO.setmode(GPIO.BOARD)
-    GPIO.setup(BTN_REBOOT,   GPIO.IN, pull_up_down=GPIO.PUD_UP)
-    GPIO.setup(BTN_SHUTDOWN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+    gpio = GpioManager()
+    gpio.setup_input(BTN_REBOOT)
+    gpio.setup_input(BTN_SHUTDOWN)
 
     state = {
         BTN_REBOOT:   {"pressed": False, "t0": 0.0, "fired": False, "name": "REBOOT"},
@@ -114,7 +113,7 @@ def main():
     except KeyboardInterrupt:
         pass
     finally:
-        try: GPIO.cleanup()
+        try: gpio.close()
         except Exception: pass
         print("[EXIT] buttons_power stopped")
 
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Utilidades compartidas por cliente, servidor y scripts de both/scripts,
+client/scripts y server/scripts (que añaden both/scripts a sys.path).
+
+- SpanWriter: spans de propagación de cambios en JSON-lines con rotación
+  (los lee both/scripts/trace_analyze.py).
+- percentile(): cuantil simple (el valor en la posición q de la lista ordenada).
+- free_port(): puerto TCP libre en 127.0.0.1 (simuladores y bancos de prueba).
+"""
+import json, socket, threading, time
+
+TRACE_MAX_BYTES = 5 * 1024 * 1024   # al superarlo se rota a <fichero>.1
+
+
+def percentile(xs, q):
+    if not xs:
+        return None
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(q * len(xs)))]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class SpanWriter:
+    """
+    Añade líneas {t, node, hop, cid, key, ...} a 'path'.
+    t = reloj de pared en ms (los nodos deben tener NTP para comparar entre sí).
+    """
+    def __init__(self, path, node: str, max_bytes: int = TRACE_MAX_BYTES):
+        self.path = path
+        self.node = node
+        self.max_bytes = int(max_bytes)
+        self.bytes_written = 0
+        self._lock = threading.Lock()
+        self._fh = None
+
+    def write(self, hop: str, cid: str, key: str, dur_ms: float = None, **extra):
+        if not cid:
+            return
+        rec = {"t": round(time.time() * 1000.0, 3), "node": self.node, "hop": hop, "cid": cid, "key": key}
+        if dur_ms is not None:
+            rec["dur_ms"] = round(dur_ms, 3)
+        rec.update(extra)
+        line = json.dumps(rec, ensure_ascii=False) + "\n"
+        try:
+            with self._lock:
+                if self._fh is None:
+                    self._fh = open(self.path, "a", encoding="utf-8")
+                self._fh.write(line)
+                self._fh.flush()
+                self.bytes_written += len(line.encode("utf-8"))
+                if self._fh.tell() > self.max_bytes:
+                    self._fh.close()
+                    self._fh = None
+                    self.path.replace(self.path.with_name(self.path.name + ".1"))
+        except Exception as e:
+            print("[WARN] trace_span:", e, flush=True)
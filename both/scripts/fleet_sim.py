@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""
+Simulador de flota: muchos client_runtime virtuales contra un server.py local.
+
+Cada cliente virtual es una copia independiente del módulo
+client/scripts/client_runtime.py (cargada con importlib, con el backend GPIO
+simulado de gpio_manager) con su propio state.json y su SyncLoop real. Las pulsaciones se
+inyectan llamando a on_press_* según un guion aleatorio (con semilla):
+pulsaciones sueltas, pares conflictivos (dos paneles, misma clave, pocos ms
+de diferencia) y periodos offline (el transporte HTTP del cliente falla).
+
+Para cada combinación tamaño de flota x PULL_INTERVAL mide:
+  - tiempo de convergencia: desde la pulsación hasta que todos los clientes
+    online tienen esa versión (ts >= ts de la pulsación) de la clave
+  - puesta al día tras volver de offline
+  - resultado LWW: el servidor termina con la escritura de mayor ts y
+    ningún cliente discrepa al final
+  - peticiones/s y CPU del servidor (y del propio simulador, que también
+    puede saturarse con flotas grandes: mirar 'sim CPU')
+
+Uso:
+  fleet_sim.py --fleet 10,50,200 --pull 0.2,1.0 --duration 30
+  fleet_sim.py --fleet 200 --server-python server/.venv/bin/python --json report.json
+"""
+import argparse, importlib.util, json, os, random, shutil, subprocess, sys
+import tempfile, threading, time
+from contextlib import redirect_stdout
+from pathlib import Path
+
+import requests
+
+from common import free_port, percentile
+
+os.environ["GPIO_BACKEND"] = "sim"  # cada cliente virtual crea su GpioManager con SimBackend
+
+REPO = Path(__file__).resolve().parents[2]
+CLIENT_RUNTIME = REPO / "client" / "scripts" / "client_runtime.py"
+SERVER_DIR = REPO / "server"
+KEYS = ("toggle", "client1", "client2")
+SAMPLE_EVERY = 0.01     # s entre comprobaciones de convergencia
+
+
+def log(*a):
+    print("[SIM]", *a, file=sys.stderr, flush=True)
+
+
+# ---- Estadísticas compartidas ----
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = {"GET": 0, "PUT": 0, "offline": 0}
+        self.writes = {}            # (cliente, key, ts) -> value  (pulsaciones y reenvíos)
+        self.pending = []           # [(key, ts, t0_monotonic)] cambios hechos online
+        self.convergence_ms = []
+        self.catchup_ms = []
+        self.catchup_pending = []   # [(VirtualClient, {key: ts objetivo}, t0)]
+
+    def count(self, kind):
+        with self.lock:
+            self.requests[kind] += 1
+
+    def record_write(self, idx, key, value, ts):
+        with self.lock:
+            self.writes.setdefault((idx, key, ts), value)
+
+
+class _Transport:
+    """Sustituye a 'requests' dentro de un cliente: cuenta peticiones y simula offline."""
+    def __init__(self, vc, stats):
+        self.vc, self.stats = vc, stats
+
+    def _check(self):
+        if not self.vc.online:
+            self.stats.count("offline")
+            raise requests.ConnectionError("simulated offline")
+
+    def get(self, url, **kw):
+        self._check()
+        self.stats.count("GET")
+        return requests.get(url, **kw)
+
+    def put(self, url, **kw):
+        self._check()
+        self.stats.count("PUT")
+        return requests.put(url, **kw)
+
+
+class VirtualClient:
+    def __init__(self, idx, workdir: Path, server_txt: Path, pull: float, stats: Stats):
+        self.idx = idx
+        self.online = True
+        spec = importlib.util.spec_from_file_location(f"client_runtime_sim{idx}", CLIENT_RUNTIME)
+        rt = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(rt)
+        self.rt = rt
+
+        rt.STATE_FILE = workdir / f"c{idx:04d}" / "state.json"
+        rt.SERVER_TXT = server_txt
+        rt.TRACE_ENABLED = False
+        rt.PULL_INTERVAL = pull
+        transport = _Transport(self, stats)
+        rt._http = lambda: transport
+        real_put = rt.put_key
+
+        def put_key(key, value, ts_ms, cid=None):
+            stats.record_write(idx, key, bool(value), int(ts_ms))
+            return real_put(key, value, ts_ms, cid)
+        rt.put_key = put_key
+
+        rt.gpio_setup()
+        rt.state_dir_prepare()
+        rt.state_load()
+        self.sync = rt.SyncLoop()
+
+    def start(self):
+        self.sync.start()
+
+    def stop(self):
+        self.sync.stop()
+
+    def press(self, key, ts_ms):
+        getattr(self.rt, f"on_press_{key}")(ts_ms)
+
+    def ts(self, key):
+        return self.rt.state.ts_of(key)
+
+
+# ---- Servidor local ----
+def start_server(python, data_dir: Path, port: int, mode: str):
+    env = dict(os.environ, TOGGLE_DATA_DIR=str(data_dir), PYTHONUNBUFFERED="1")
+    gunicorn = Path(python).parent / "gunicorn"
+    if mode == "gunicorn" or (mode == "auto" and gunicorn.exists()):
+        cmd = [str(gunicorn), "-k", "gevent", "-w", "1", "-b", f"127.0.0.1:{port}", "server:app"]
+    else:
+        cmd = [python, "-c",
+               f"from server import app; app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    proc = subprocess.Popen(cmd, cwd=SERVER_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    t0 = time.monotonic()
+    while time.monotonic() - t0 < 15:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with code {proc.returncode}: {' '.join(cmd)}")
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/api/state", timeout=0.5).ok:
+                return proc, cmd[0]
+        except requests.RequestException:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("server did not come up")
+
+
+def proc_cpu_seconds(pid: int) -> float:
+    """CPU (user+sys) del proceso y sus hijos (workers de gunicorn), vía /proc."""
+    total, todo = 0, [pid]
+    while todo:
+        p = todo.pop()
+        try:
+            fields = Path(f"/proc/{p}/stat").read_text().rsplit(")", 1)[1].split()
+            total += int(fields[11]) + int(fields[12])
+            todo += [int(c) for c in Path(f"/proc/{p}/task/{p}/children").read_text().split()]
+        except (OSError, IndexError, ValueError):
+            pass
+    return total / os.sysconf("SC_CLK_TCK")
+
+
+# ---- Guion ----
+def make_script(rng, fleet, duration, rate, conflict_prob, offline_frac):
+    """[(t, 'press', idx, key) | (t, 'offline'/'online', idx, None)] ordenado por t."""
+    events = []
+    for _ in range(int(rate * duration)):
+        t = rng.uniform(0, duration)
+        idx, key = rng.randrange(fleet), rng.choice(KEYS)
+        events.append((t, "press", idx, key))
+        if fleet > 1 and rng.random() < conflict_prob:
+            other = rng.choice([i for i in range(fleet) if i != idx])
+            events.append((t + rng.uniform(0, 0.03), "press", other, key))
+    for idx in rng.sample(range(fleet), int(round(fleet * offline_frac))):
+        t = rng.uniform(0, duration * 0.7)
+        events.append((t, "offline", idx, None))
+        events.append((t + rng.uniform(2.0, 8.0), "online", idx, None))
+    return sorted(events, key=lambda e: e[0])
+
+
+def sampler(clients, stats, stop_evt):
+    while not stop_evt.is_set():
+        now = time.monotonic()
+        online = [c for c in clients if c.online]
+        with stats.lock:
+            still = []
+            for key, ts, t0 in stats.pending:
+                if all(c.ts(key) >= ts for c in online):
+                    stats.convergence_ms.append((now - t0) * 1000.0)
+                else:
+                    still.append((key, ts, t0))
+            stats.pending = still
+            still = []
+            for c, target, t0 in stats.catchup_pending:
+                if not c.online:
+                    continue
+                if all(c.ts(k) >= ts for k, ts in target.items()):
+                    stats.catchup_ms.append((now - t0) * 1000.0)
+                else:
+                    still.append((c, target, t0))
+            stats.catchup_pending = still
+        time.sleep(SAMPLE_EVERY)
+
+
+def run_config(args, fleet, pull, seed):
+    stats = Stats()
+    rng = random.Random(seed)
+    work = Path(tempfile.mkdtemp(prefix="fleet-sim-"))
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    (work / "server").mkdir()
+    server_txt = work / "server.txt"
+    server_txt.write_text(base + "\n", encoding="utf-8")
+    proc, server_bin = start_server(args.server_python, work / "server", port, args.server)
+    clients = []
+    try:
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            clients = [VirtualClient(i, work, server_txt, pull, stats) for i in range(fleet)]
+            for c in clients:
+                c.start()
+            time.sleep(max(1.0, 3 * pull))  # primera sincronización de todos
+
+            script = make_script(rng, fleet, args.duration, args.rate, args.conflicts, args.offline)
+            stop_evt = threading.Event()
+            smp = threading.Thread(target=sampler, args=(clients, stats, stop_evt), daemon=True)
+            smp.start()
+
+            cpu0, proc0, wall0 = proc_cpu_seconds(proc.pid), time.process_time(), time.monotonic()
+            with stats.lock:
+                req0 = dict(stats.requests)
+            for t, kind, idx, key in script:
+                delay = wall0 + t - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                c = clients[idx]
+                if kind == "offline":
+                    c.online = False
+                elif kind == "online":
+                    target = {k: int(v) for k, v in
+                              requests.get(f"{base}/api/state", timeout=2).json()["ts"].items() if k in KEYS}
+                    with stats.lock:
+                        stats.catchup_pending.append((c, target, time.monotonic()))
+                    c.online = True
+                else:
+                    ts_ms = int(time.time() * 1000)
+                    if c.online:
+                        with stats.lock:
+                            stats.pending.append((key, ts_ms, time.monotonic()))
+                    threading.Thread(target=c.press, args=(key, ts_ms), daemon=True).start()
+            time.sleep(max(0.0, wall0 + args.duration - time.monotonic()))
+            dur = time.monotonic() - wall0
+            cpu1, proc1 = proc_cpu_seconds(proc.pid), time.process_time()
+            with stats.lock:
+                req1 = dict(stats.requests)
+
+            # Asentamiento: todos online y esperar a que converjan
+            for c in clients:
+                if not c.online:
+                    c.online = True
+            settle_deadline = time.monotonic() + max(args.settle, 10 * pull)
+            while time.monotonic() < settle_deadline:
+                with stats.lock:
+                    if not stats.pending and not stats.catchup_pending:
+                        break
+                time.sleep(0.05)
+            time.sleep(3 * pull)
+            stop_evt.set()
+
+            final = requests.get(f"{base}/api/state", timeout=2).json()
+    finally:
+        for c in clients:
+            c.stop()
+        proc.terminate()
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        shutil.rmtree(work, ignore_errors=True)
+
+    # LWW: la escritura de mayor ts de cada clave debe ser la que queda en el servidor
+    lww_violations, ties = 0, 0
+    for key in KEYS:
+        ws = [(ts, v) for (_i, k, ts), v in stats.writes.items() if k == key]
+        if not ws:
+            continue
+        top = max(ts for ts, _v in ws)
+        vals = {v for ts, v in ws if ts == top}
+        if len(vals) > 1:
+            ties += 1
+            continue
+        if int(final["ts"][key]) != top or bool(final[key]) != vals.pop():
+            lww_violations += 1
+    disagree = sum(1 for c in clients
+                   if any(c.rt.state.get(k) != bool(final[k]) or c.ts(k) != int(final["ts"][k]) for k in KEYS))
+
+    conv = stats.convergence_ms
+    return {
+        "fleet": fleet,
+        "pull_interval": pull,
+        "server": server_bin,
+        "presses": sum(1 for (_i, _k, _t) in stats.writes),
+        "req_per_s": (req1["GET"] + req1["PUT"] - req0["GET"] - req0["PUT"]) / dur,
+        "put_per_s": (req1["PUT"] - req0["PUT"]) / dur,
+        "server_cpu_pct": 100.0 * (cpu1 - cpu0) / dur,
+        "sim_cpu_pct": 100.0 * (proc1 - proc0) / dur,
+        "convergence_ms": {
+            "n": len(conv),
+            "p50": percentile(conv, 0.50),
+            "p90": percentile(conv, 0.90),
+            "p99": percentile(conv, 0.99),
+            "max": max(conv) if conv else None,
+        },
+        "unconverged": len(stats.pending),
+        "catchup_ms": {
+            "n": len(stats.catchup_ms),
+            "p50": percentile(stats.catchup_ms, 0.50),
+            "p99": percentile(stats.catchup_ms, 0.99),
+        },
+        "lww_violations": lww_violations,
+        "lww_ties": ties,
+        "clients_disagreeing": disagree,
+    }
+
+
+def _fmt(v, nd=0):
+    return "-" if v is None else f"{v:.{nd}f}"
+
+
+def print_report(rows):
+    print(f"{'fleet':>6}{'pull s':>8}{'req/s':>9}{'srv CPU%':>10}{'sim CPU%':>10}"
+          f"{'conv p50':>10}{'p90':>8}{'p99':>8}{'max':>8}{'unconv':>8}"
+          f"{'catchup p50':>13}{'p99':>8}{'LWW bad':>9}{'disagree':>10}")
+    for r in rows:
+        cv, cu = r["convergence_ms"], r["catchup_ms"]
+        print(f"{r['fleet']:>6}{r['pull_interval']:>8.2f}{r['req_per_s']:>9.1f}"
+              f"{r['server_cpu_pct']:>10.1f}{r['sim_cpu_pct']:>10.1f}"
+              f"{_fmt(cv['p50']):>10}{_fmt(cv['p90']):>8}{_fmt(cv['p99']):>8}{_fmt(cv['max']):>8}"
+              f"{r['unconverged']:>8}{_fmt(cu['p50']):>13}{_fmt(cu['p99']):>8}"
+              f"{r['lww_violations']:>9}{r['clients_disagreeing']:>10}")
+    print("(tiempos en ms; conv = pulsación -> todos los clientes online con esa versión)")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Simulador de convergencia de una flota de client_runtime")
+    ap.add_argument("--fleet", default="10,50,200", help="tamaños de flota, separados por comas")
+    ap.add_argument("--pull", default="0.2,1.0", help="valores de PULL_INTERVAL (s), separados por comas")
+    ap.add_argument("--duration", type=float, default=30.0, help="segundos de guion por configuración")
+    ap.add_argument("--rate", type=float, default=2.0, help="pulsaciones por segundo en toda la flota")
+    ap.add_argument("--conflicts", type=float, default=0.1, help="probabilidad de pulsación conflictiva")
+    ap.add_argument("--offline", type=float, default=0.1, help="fracción de clientes con un periodo offline")
+    ap.add_argument("--settle", type=float, default=5.0, help="espera máxima de convergencia al final (s)")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--server", choices=("auto", "gunicorn", "flask"), default="auto",
+                    help="gunicorn+gevent como en producción, o el servidor de desarrollo de Flask")
+    ap.add_argument("--server-python", default=sys.executable,
+                    help="python con Flask instalado (p.ej. server/.venv/bin/python)")
+    ap.add_argument("--json", help="guarda también el informe en este fichero JSON")
+    args = ap.parse_args()
+
+    rows = []
+    for fleet in [int(x) for x in args.fleet.split(",") if x]:
+        for pull in [float(x) for x in args.pull.split(",") if x]:
+            log(f"fleet={fleet} pull={pull}s duration={args.duration}s …")
+            rows.append(run_config(args, fleet, pull, args.seed))
+    print_report(rows)
+    if args.json:
+        Path(args.json).write_text(json.dumps(rows, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
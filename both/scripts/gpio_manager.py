@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+Capa GPIO compartida por los scripts (numeración BOARD).
+
+- Caché del último nivel escrito en cada pin: las escrituras redundantes no
+  llegan al hardware.
+- Con el planificador arrancado (start()), las escrituras se acumulan y se
+  aplican juntas en el siguiente tick; sin él, se aplican al momento.
+- Patrones temporizados (blink, pulse, breathe) y tareas periódicas
+  (every) en un único hilo, en vez de un bucle con sleep por script.
+- Cada proceso solo limpia los pines que ha configurado él (close()).
+- Backend simulado (GPIO_BACKEND=sim o SimBackend()) que registra cada
+  escritura con su instante, para pruebas y benchmarks sin Raspberry.
+
+Uso desde un script de otra carpeta:
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "both" / "scripts"))
+    from gpio_manager import GpioManager
+"""
+import math, os, threading, time
+
+TICK_SEC = 0.01
+
+
+class RPiBackend:
+    def __init__(self):
+        import RPi.GPIO as GPIO
+        self.GPIO = GPIO
+        GPIO.setwarnings(False)
+        GPIO.setmode(GPIO.BOARD)
+
+    def setup_out(self, pin, level):
+        self.GPIO.setup(pin, self.GPIO.OUT, initial=self.GPIO.HIGH if level else self.GPIO.LOW)
+
+    def setup_in(self, pin, pull_up=True):
+        self.GPIO.setup(pin, self.GPIO.IN,
+                        pull_up_down=self.GPIO.PUD_UP if pull_up else self.GPIO.PUD_DOWN)
+
+    def write(self, pin, level):
+        self.GPIO.output(pin, self.GPIO.HIGH if level else self.GPIO.LOW)
+
+    def read(self, pin) -> int:
+        return self.GPIO.input(pin)
+
+    def pwm_start(self, pin, freq, duty):
+        p = self.GPIO.PWM(pin, freq)
+        p.start(duty)
+        return p
+
+    def pwm_duty(self, handle, duty):
+        handle.ChangeDutyCycle(duty)
+
+    def pwm_stop(self, handle):
+        handle.stop()
+
+    def cleanup(self, pins):
+        if pins:
+            self.GPIO.cleanup(list(pins))
+
+
+class SimBackend:
+    """Sin hardware: guarda cada escritura como (t_monotonic, pin, nivel o ('duty', x))."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.log = []
+        self.levels = {}
+        self.inputs = {}    # pin -> nivel leído (1 = reposo con pull-up)
+
+    def setup_out(self, pin, level):
+        with self._lock:
+            self.levels[pin] = bool(level)
+
+    def setup_in(self, pin, pull_up=True):
+        with self._lock:
+            self.inputs.setdefault(pin, 1 if pull_up else 0)
+
+    def write(self, pin, level):
+        with self._lock:
+            self.levels[pin] = bool(level)
+            self.log.append((time.monotonic(), pin, bool(level)))
+
+    def read(self, pin) -> int:
+        return self.inputs.get(pin, 1)
+
+    def set_input(self, pin, level):
+        """Para simular un botón: 0 = pulsado (a GND), 1 = libre."""
+        self.inputs[pin] = 1 if level else 0
+
+    def pwm_start(self, pin, freq, duty):
+        with self._lock:
+            self.log.append((time.monotonic(), pin, ("duty", duty)))
+        return pin
+
+    def pwm_duty(self, handle, duty):
+        with self._lock:
+            self.log.append((time.monotonic(), handle, ("duty", duty)))
+
+    def pwm_stop(self, handle):
+        pass
+
+    def cleanup(self, pins):
+        pass
+
+    def writes(self, pin=None):
+        with self._lock:
+            return [e for e in self.log if pin is None or e[1] == pin]
+
+
+def default_backend():
+    if os.environ.get("GPIO_BACKEND", "").lower() == "sim":
+        return SimBackend()
+    return RPiBackend()
+
+
+class _Blink:
+    def __init__(self, on_s, off_s, count, end_level, t0):
+        self.on_s, self.off_s = float(on_s), float(off_s)
+        self.count, self.end_level, self.t0 = count, end_level, t0
+        self.done = threading.Event()
+
+    def level(self, now):
+        """Nivel en 'now', o None si el patrón ya terminó."""
+        period = self.on_s + self.off_s
+        n, phase = divmod(now - self.t0, period)
+        if self.count is not None and n >= self.count:
+            return None
+        return phase < self.on_s
+
+
+class _Breathe:
+    def __init__(self, period_s, count, end_level, t0):
+        self.period_s, self.count, self.end_level, self.t0 = float(period_s), count, end_level, t0
+        self.handle = None
+        self.duty = None
+        self.done = threading.Event()
+
+    def duty_at(self, now):
+        n, phase = divmod(now - self.t0, self.period_s)
+        if self.count is not None and n >= self.count:
+            return None
+        return round(50.0 * (1.0 - math.cos(2.0 * math.pi * phase / self.period_s)))
+
+
+class GpioManager:
+    def __init__(self, backend=None, tick=TICK_SEC):
+        self.backend = backend or default_backend()
+        self.tick = float(tick)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._written = {}      # pin -> último nivel escrito
+        self._pending = {}      # pin -> nivel pedido para el próximo tick
+        self._patterns = {}     # pin -> _Blink/_Breathe
+        self._tasks = []        # [[siguiente, periodo, fn]]
+        self._pins = set()      # pines configurados por este proceso
+        self.writes = 0
+        self.skipped = 0
+        self.steps = 0          # ticks ejecutados por el planificador
+        self.overruns = 0       # ticks que tardaron más que 'tick' (tareas lentas)
+        self.step_max = 0.0
+
+    # ---- configuración ----
+    def setup_output(self, pin, level=False):
+        self.backend.setup_out(pin, level)
+        with self._lock:
+            self._written[pin] = bool(level)
+            self._pins.add(pin)
+
+    def setup_input(self, pin, pull_up=True):
+        self.backend.setup_in(pin, pull_up)
+        with self._lock:
+            self._pins.add(pin)
+
+    def read(self, pin) -> int:
+        return self.backend.read(pin)
+
+    # ---- escrituras ----
+    def _write(self, pin, level):
+        """Escribe si el nivel cambia. Llamar con _lock tomado."""
+        if self._written.get(pin) == level:
+            self.skipped += 1
+            return
+        self.backend.write(pin, level)
+        self._written[pin] = level
+        self.writes += 1
+
+    def set(self, pin, level, now=False):
+        """Fija un nivel (cancela el patrón del pin). Con el planificador activo va al próximo tick."""
+        level = bool(level)
+        with self._lock:
+            self._cancel(pin)
+            if now or self._thread is None:
+                self._pending.pop(pin, None)
+                self._write(pin, level)
+                return
+            self._pending[pin] = level
+        self._wake.set()
+
+    def set_many(self, levels: dict, now=False):
+        with self._lock:
+            for pin, level in levels.items():
+                self._cancel(pin)
+                if now or self._thread is None:
+                    self._pending.pop(pin, None)
+                    self._write(pin, bool(level))
+                else:
+                    self._pending[pin] = bool(level)
+        self._wake.set()
+
+    def flush(self):
+        with self._lock:
+            for pin, level in self._pending.items():
+                self._write(pin, level)
+            self._pending.clear()
+
+    # ---- patrones ----
+    def _cancel(self, pin):
+        pat = self._patterns.pop(pin, None)
+        if pat is None:
+            return
+        if isinstance(pat, _Breathe) and pat.handle is not None:
+            self.backend.pwm_stop(pat.handle)
+            self._written.pop(pin, None)  # tras PWM el nivel real es desconocido
+        pat.done.set()
+
+    def _add_pattern(self, pin, pat):
+        with self._lock:
+            self._cancel(pin)
+            self._pending.pop(pin, None)
+            self._patterns[pin] = pat
+        self.start()
+        self._wake.set()
+        return pat.done
+
+    def blink(self, pin, on_s, off_s=None, count=None, end_level=False):
+        """Parpadeo (count=None: hasta set()/otro patrón). Devuelve un Event que se activa al acabar."""
+        off_s = on_s if off_s is None else off_s
+        if on_s < 0 or off_s < 0 or on_s + off_s <= 0:
+            raise ValueError(f"blink: on_s/off_s inválidos ({on_s}, {off_s})")
+        return self._add_pattern(pin, _Blink(on_s, off_s, count, end_level, time.monotonic()))
+
+    def pulse(self, pin, on_s, end_level=False):
+        """Un único encendido de on_s segundos."""
+        return self.blink(pin, on_s, 0.0, count=1, end_level=end_level)
+
+    def breathe(self, pin, period_s=2.0, count=None, end_level=False):
+        """Respiración por PWM (seno entre 0 y 100 % de duty)."""
+        if period_s <= 0:
+            raise ValueError(f"breathe: period_s inválido ({period_s})")
+        return self._add_pattern(pin, _Breathe(period_s, count, end_level, time.monotonic()))
+
+    def every(self, period_s, fn):
+        """Llama fn() cada period_s en el hilo del planificador (fn no debe bloquear)."""
+        with self._lock:
+            self._tasks.append([time.monotonic(), float(period_s), fn])
+        self.start()
+        self._wake.set()
+
+    # ---- planificador ----
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, daemon=True, name="GPIO_SCHED")
+        self._thread.start()
+
+    def _step(self, now):
+        """Un tick: avanza patrones, aplica lo pendiente y lanza tareas vencidas."""
+        with self._lock:
+            for pin, pat in list(self._patterns.items()):
+                try:
+                    self._advance(pin, pat, now)
+                except Exception as e:
+                    # un patrón roto no puede tumbar el planificador (LEDs y tareas de todo el proceso)
+                    print(f"[GPIO] pattern error pin={pin}: {e}", flush=True)
+                    try:
+                        self._cancel(pin)
+                    except Exception:
+                        self._patterns.pop(pin, None)
+                        pat.done.set()
+                    self._pending[pin] = pat.end_level
+            for pin, level in self._pending.items():
+                try:
+                    self._write(pin, level)
+                except Exception as e:
+                    print(f"[GPIO] write error pin={pin}: {e}", flush=True)
+            self._pending.clear()
+            due = [t for t in self._tasks if t[0] <= now]
+            for t in due:
+                t[0] = now + t[1]
+            busy = bool(self._patterns)
+            next_task = min((t[0] for t in self._tasks), default=None)
+        for t in due:
+            try:
+                t[2]()
+            except Exception as e:
+                print(f"[GPIO] task error: {e}", flush=True)
+        return busy, next_task
+
+    def _advance(self, pin, pat, now):
+        """Avanza un patrón. Llamar con _lock tomado."""
+        if isinstance(pat, _Blink):
+            level = pat.level(now)
+            if level is None:
+                del self._patterns[pin]
+                self._pending[pin] = pat.end_level
+                pat.done.set()
+            else:
+                self._pending[pin] = level
+        else:
+            duty = pat.duty_at(now)
+            if duty is None:
+                self._cancel(pin)
+                self._pending[pin] = pat.end_level
+            elif pat.handle is None:
+                pat.handle = self.backend.pwm_start(pin, 200, duty)
+                pat.duty = duty
+            elif duty != pat.duty:
+                self.backend.pwm_duty(pat.handle, duty)
+                pat.duty = duty
+
+    def _run(self):
+        while not self._stop.is_set():
+            t0 = time.monotonic()
+            busy, next_task = self._step(t0)
+            dur = time.monotonic() - t0
+            self.steps += 1
+            self.step_max = max(self.step_max, dur)
+            if dur > self.tick:
+                self.overruns += 1
+            timeout = self.tick if busy else None
+            if next_task is not None:
+                wait = max(0.0, next_task - time.monotonic())
+                timeout = wait if timeout is None else min(timeout, wait)
+            self._wake.wait(timeout)
+            self._wake.clear()
+
+    def close(self, cleanup=True, final_level=False):
+        """
+        Para el planificador y aplica lo pendiente. cleanup=True pone a
+        final_level las salidas de ESTE proceso y libera solo sus pines;
+        cleanup=False deja los pines como estén (p.ej. el LED de boot fijo).
+        """
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+        with self._lock:
+            for pin in list(self._patterns):
+                self._cancel(pin)
+        self.flush()
+        if cleanup:
+            with self._lock:
+                for pin in list(self._written):
+                    self._write(pin, bool(final_level))
+                pins = set(self._pins)
+            try:
+                self.backend.cleanup(pins)
+            except Exception:
+                pass
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Telemetría local de un proceso (pensada para el cliente en una Pi Zero).
+
+- LoopStats: iteraciones, tiempo ocupado y overruns (iteraciones que tardan
+  más que su presupuesto) de un bucle.
+- HttpStats: peticiones, errores y latencias por método.
+- thread_cpu(): tiempo de CPU de cada hilo vivo (reloj por hilo de Linux).
+- sample_profile(): perfilador por muestreo bajo demanda sobre
+  sys._current_frames(); devuelve pilas "colapsadas" (formato flamegraph).
+- serve(): servidor HTTP en 127.0.0.1 con
+    GET /stats                     JSON de collect()
+    GET /profile?seconds=5&hz=50   texto: pilas colapsadas + funciones más vistas
+
+Uso:
+    curl -s localhost:PORT/stats | python3 -m json.tool
+    curl -s "localhost:PORT/profile?seconds=10" > perfil.txt
+"""
+import json, math, os, sys, threading, time
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from common import percentile
+
+PROFILE_MAX_SEC = 60
+PROFILE_MAX_HZ = 200
+
+
+class LoopStats:
+    """Contadores de un bucle. Se llama tick(duración) al final de cada iteración."""
+    def __init__(self, budget_s: float):
+        self.budget_s = float(budget_s)
+        self.iterations = 0
+        self.overruns = 0
+        self.busy_s = 0.0
+        self.max_s = 0.0
+
+    def tick(self, dur_s: float):
+        # sin lock: cada bucle lo actualiza desde un único hilo
+        self.iterations += 1
+        self.busy_s += dur_s
+        if dur_s > self.max_s:
+            self.max_s = dur_s
+        if dur_s > self.budget_s:
+            self.overruns += 1
+
+    def to_dict(self) -> dict:
+        n = self.iterations
+        return {
+            "iterations": n,
+            "overruns": self.overruns,
+            "budget_ms": round(self.budget_s * 1000.0, 3),
+            "avg_ms": round(self.busy_s / n * 1000.0, 3) if n else None,
+            "max_ms": round(self.max_s * 1000.0, 3),
+            "busy_ms": round(self.busy_s * 1000.0, 1),
+        }
+
+
+class HttpStats:
+    """Peticiones por método: total, errores, por código y latencias recientes."""
+    def __init__(self, window: int = 200):
+        self._lock = threading.Lock()
+        self._by_method = {}
+        self.window = window
+
+    def record(self, method: str, dt_s: float, status=None, error=None):
+        """error=None: cuenta como error una excepción (status None) o un 5xx."""
+        if error is None:
+            error = status is None or status >= 500
+        with self._lock:
+            m = self._by_method.get(method)
+            if m is None:
+                m = self._by_method[method] = {"n": 0, "errors": 0, "status": Counter(),
+                                               "lat": deque(maxlen=self.window)}
+            m["n"] += 1
+            if error:
+                m["errors"] += 1
+            m["status"][str(status)] += 1
+            m["lat"].append(round(dt_s * 1000.0, 3))
+
+    def to_dict(self) -> dict:
+        out = {}
+        with self._lock:
+            for method, m in self._by_method.items():
+                lat = list(m["lat"])
+                out[method] = {
+                    "n": m["n"],
+                    "errors": m["errors"],
+                    "status": dict(m["status"]),
+                    "p50_ms": percentile(lat, 0.50),
+                    "p95_ms": percentile(lat, 0.95),
+                    "max_ms": max(lat) if lat else None,
+                }
+        return out
+
+
+def thread_cpu() -> dict:
+    """{nombre del hilo: s de CPU} de los hilos vivos (vacío fuera de Linux)."""
+    out = {}
+    for t in threading.enumerate():
+        try:
+            clk = time.pthread_getcpuclockid(t.ident)
+            out[t.name] = round(time.clock_gettime(clk), 3)
+        except (AttributeError, OSError, TypeError):
+            pass
+    return out
+
+
+def process_io() -> dict:
+    """Bytes leídos/escritos por el proceso según el kernel (/proc/self/io)."""
+    out = {}
+    try:
+        with open("/proc/self/io", encoding="ascii") as f:
+            for line in f:
+                k, _, v = line.partition(":")
+                if k in ("rchar", "wchar", "read_bytes", "write_bytes"):
+                    out[k] = int(v)
+    except OSError:
+        pass
+    return out
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+_profile_lock = threading.Lock()
+
+
+def sample_profile(seconds: float = 5.0, hz: float = 50.0, top: int = 20) -> str:
+    """
+    Muestrea las pilas de todos los hilos durante 'seconds' a 'hz' muestras/s.
+    Devuelve texto: una línea "hilo;f1;f2;... N" por pila (apta para
+    flamegraph.pl) y después las funciones más vistas en lo alto de la pila.
+    Solo un perfil a la vez (el muestreo en sí cuesta CPU).
+    """
+    seconds = min(max(float(seconds), 0.1), PROFILE_MAX_SEC)
+    hz = min(max(float(hz), 1.0), PROFILE_MAX_HZ)
+    if not _profile_lock.acquire(blocking=False):
+        return "# otro perfil en curso\n"
+    try:
+        me = threading.get_ident()
+        stacks = Counter()
+        leaves = Counter()
+        samples = 0
+        period = 1.0 / hz
+        t_end = time.monotonic() + seconds
+        while time.monotonic() < t_end:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                if not labels:
+                    continue
+                leaves[labels[0]] += 1
+                labels.append(names.get(ident, str(ident)))
+                stacks[";".join(reversed(labels))] += 1
+            samples += 1
+            time.sleep(period)
+    finally:
+        _profile_lock.release()
+
+    lines = [f"# {samples} muestras en {seconds:.1f} s a {hz:.0f} Hz (pilas colapsadas: hilo;...;hoja N)"]
+    lines += [f"{stack} {n}" for stack, n in stacks.most_common()]
+    lines.append("")
+    lines.append(f"# top {top} (muestras en lo alto de la pila)")
+    lines += [f"# {n:6d}  {label}" for label, n in leaves.most_common(top)]
+    return "\n".join(lines) + "\n"
+
+
+def serve(port: int, collect, host: str = "127.0.0.1"):
+    """Arranca el servidor de telemetría en un hilo daemon. collect() -> dict para /stats."""
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, code, body: str, ctype: str):
+            data = body.encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            u = urlparse(self.path)
+            q = {k: v[-1] for k, v in parse_qs(u.query).items()}
+            if u.path == "/profile":
+                try:
+                    seconds, hz = float(q.get("seconds", 5)), float(q.get("hz", 50))
+                    top = int(q.get("top", 20))
+                    if not (math.isfinite(seconds) and math.isfinite(hz)):
+                        raise ValueError("not finite")
+                except ValueError:
+                    self._send(400, "seconds/hz deben ser números y top un entero\n",
+                               "text/plain; charset=utf-8")
+                    return
+            try:
+                if u.path == "/stats":
+                    self._send(200, json.dumps(collect(), ensure_ascii=False), "application/json")
+                elif u.path == "/profile":
+                    self._send(200, sample_profile(seconds, hz, top), "text/plain; charset=utf-8")
+                else:
+                    self._send(404, "not found\n", "text/plain; charset=utf-8")
+            except Exception as e:
+                self._send(500, f"error: {e}\n", "text/plain; charset=utf-8")
+
+        def log_message(self, fmt, *args):
+            pass  # sin ruido en el journal
+
+    srv = ThreadingHTTPServer((host, int(port)), Handler)
+    srv.daemon_threads = True
+    threading.Thread(target=srv.serve_forever, daemon=True, name="TELEMETRY").start()
+    print(f"[TELEMETRY] http://{host}:{srv.server_address[1]}/stats", flush=True)
+    return srv
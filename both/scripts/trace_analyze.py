@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Analizador offline de trazas de propagación de cambios.
+
+Lee los trace.jsonl de clientes (client/trace.jsonl) y servidor
+(server/trace.jsonl), agrupa los spans por change ID y reconstruye, para cada
+cambio, cuánto tardó cada salto:
+
+  press -> local_apply     LED local encendido (hilo del botón + state.json)
+  put                      duración del PUT HTTP (incluye red + servidor)
+  press -> server_commit   hasta que el servidor lo escribe en disco
+  server write             escritura de state.json en el servidor
+  server_commit -> apply   hasta que OTRO cliente lo aplica (su poll)
+  press -> apply           extremo a extremo, por cada cliente receptor
+
+Los tiempos entre nodos usan reloj de pared: sin NTP los saltos que cruzan
+máquinas pueden salir sesgados (o negativos).
+
+Uso:
+  trace_analyze.py client-a/trace.jsonl client-b/trace.jsonl server/trace.jsonl
+  trace_analyze.py --top 5 --json *.jsonl
+"""
+import argparse, json, sys
+from collections import defaultdict
+
+from common import percentile
+
+SEGMENTS = [
+    "press->local_apply",
+    "put",
+    "press->server_commit",
+    "server_write",
+    "server_commit->apply",
+    "press->apply",
+]
+
+
+def load_spans(paths):
+    spans = defaultdict(list)  # cid -> [span, ...]
+    bad = 0
+    for p in paths:
+        with open(p, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rec = json.loads(line)
+                    spans[rec["cid"]].append(rec)
+                except Exception:
+                    bad += 1
+    if bad:
+        print(f"[WARN] {bad} líneas ignoradas (JSON inválido o sin cid)", file=sys.stderr)
+    return spans
+
+
+def change_latencies(recs):
+    """Devuelve {segmento: [ms, ...]} para un cambio (lista de spans del mismo cid)."""
+    by_hop = defaultdict(list)
+    for r in recs:
+        by_hop[r.get("hop")].append(r)
+    out = defaultdict(list)
+
+    press = by_hop["press"][0] if by_hop["press"] else None
+    origin = press["node"] if press else None
+    t_press = float(press.get("t_press", press["t"])) if press else None
+
+    for r in by_hop["local_apply"]:
+        if "dur_ms" in r:
+            out["press->local_apply"].append(r["dur_ms"])
+    for r in by_hop["put"]:
+        if r.get("status") and 200 <= int(r["status"]) < 300 and "dur_ms" in r:
+            out["put"].append(r["dur_ms"])
+
+    commit = by_hop["server_commit"][0] if by_hop["server_commit"] else None
+    if commit:
+        if "write_ms" in commit:
+            out["server_write"].append(commit["write_ms"])
+        if t_press is not None:
+            out["press->server_commit"].append(commit["t"] - t_press)
+        # sin pulsación (p.ej. dashboard web) el origen es la recepción en el servidor
+        if t_press is None and by_hop["server_recv"]:
+            t_press = by_hop["server_recv"][0]["t"]
+
+    for r in by_hop["client_apply"]:
+        if r["node"] == origin:
+            continue
+        if commit:
+            out["server_commit->apply"].append(r["t"] - commit["t"])
+        if t_press is not None:
+            out["press->apply"].append(r["t"] - t_press)
+    return out
+
+
+def summarize(spans):
+    agg = defaultdict(list)
+    worst = []  # (press->apply máx, cid)
+    for cid, recs in spans.items():
+        lat = change_latencies(recs)
+        for seg, xs in lat.items():
+            agg[seg].extend(xs)
+        if lat.get("press->apply"):
+            worst.append((max(lat["press->apply"]), cid))
+    table = {}
+    for seg in SEGMENTS:
+        xs = agg.get(seg, [])
+        table[seg] = {
+            "n": len(xs),
+            "p50": percentile(xs, 0.50),
+            "p90": percentile(xs, 0.90),
+            "p99": percentile(xs, 0.99),
+            "max": max(xs) if xs else None,
+        }
+    worst.sort(reverse=True)
+    return table, worst
+
+
+def _fmt(v):
+    return "-" if v is None else f"{v:.1f}"
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Latencias de propagación por cambio a partir de trace.jsonl")
+    ap.add_argument("files", nargs="+", help="ficheros trace.jsonl (clientes y servidor)")
+    ap.add_argument("--top", type=int, default=0, help="lista los N cambios más lentos extremo a extremo")
+    ap.add_argument("--json", action="store_true", help="salida JSON en vez de tabla")
+    args = ap.parse_args()
+
+    spans = load_spans(args.files)
+    table, worst = summarize(spans)
+
+    if args.json:
+        json.dump({"changes": len(spans), "segments": table,
+                   "worst": [{"cid": c, "press_to_apply_ms": ms} for ms, c in worst[:args.top]]},
+                  sys.stdout, indent=2)
+        print()
+        return
+
+    print(f"cambios: {len(spans)}")
+    print(f"{'segmento (ms)':<24}{'n':>7}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}")
+    for seg in SEGMENTS:
+        row = table[seg]
+        print(f"{seg:<24}{row['n']:>7}{_fmt(row['p50']):>10}{_fmt(row['p90']):>10}"
+              f"{_fmt(row['p99']):>10}{_fmt(row['max']):>10}")
+    if args.top:
+        print()
+        print("cambios más lentos (press->apply):")
+        for ms, cid in worst[:args.top]:
+            print(f"  {ms:10.1f} ms  {cid}")
+
+
+if __name__ == "__main__":
+    main()
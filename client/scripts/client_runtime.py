@@ -1,10 +1,21 @@
 #!/usr/bin/env python3
-import time, threading, json, signal, sys
+import time
+_T0 = time.monotonic()  # origen de la línea de tiempo de arranque
+
+import threading, json, signal, sys, socket, os
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from pathlib import Path
 from urllib.parse import urlparse
 
-import RPi.GPIO as GPIO
-import requests
+_SHARED = str(Path(__file__).resolve().parents[2] / "both" / "scripts")
+if _SHARED not in sys.path:
+    sys.path.insert(0, _SHARED)
+from gpio_manager import GpioManager  # RPi.GPIO (o GPIO_BACKEND=sim)
+import telemetry
+from common import SpanWriter
+# 'requests' se importa bajo demanda (ver _http()): en una Pi Zero tarda ~0.5 s
 
 # ------------ Config (BOARD numbering) ------------
 # LEDs
@@ -22,6 +33,15 @@ BOARD_BTN_CLIENT2 = 36
 STATE_FILE  = Path("/home/pi/Desktop/remote-toggle-module/client/state.json")
 SERVER_TXT  = Path("/home/pi/Desktop/config-local/server.txt")
 BOOT_READY_FLAG = Path("/run/boot-ready")
+TRACE_FILE  = STATE_FILE.parent / "trace.jsonl"
+
+# Trazas de propagación de cambios (JSON-lines, ver both/scripts/trace_analyze.py)
+TRACE_ENABLED   = True
+NODE_ID = socket.gethostname()
+
+# Telemetría local (both/scripts/telemetry.py): GET /stats y /profile en
+# 127.0.0.1:<puerto>. 0 = desactivada (se activa con un drop-in de systemd).
+TELEMETRY_PORT = int(os.environ.get("TOGGLE_TELEMETRY_PORT", "0"))
 
 # Botón
 DEBOUNCE_MS    = 50
@@ -30,40 +50,201 @@ POLL_BTN_MS    = 10
 # Sync REST
 PULL_INTERVAL  = 0.2   # segundos
 HTTP_TIMEOUT   = 1.0   # segundos
+
+# Suscripción: solo se piden al servidor las claves (o prefijos) que este
+# panel muestra en sus LEDs; vacías las dos = todas
+SUBSCRIBE_KEYS     = ("toggle", "client1", "client2")
+SUBSCRIBE_PREFIXES = ()
+
+# Multi-endpoint (server.txt admite varias URLs del mismo servidor: LAN, pública…)
+LATENCY_WINDOW   = 50     # muestras de latencia por endpoint
+HEDGE_MIN_SAMPLES = 5     # por debajo de esto no se fía del p95
+HEDGE_DEFAULT_SEC = 0.25  # retardo del duplicado mientras no hay p95
+HEDGE_MIN_SEC    = 0.05   # nunca lanzar el duplicado antes de esto
+
+# Arranque rápido: botones y LEDs (desde state.json) activos antes de la primera
+# sincronización, que corre en segundo plano. False = arranque secuencial antiguo.
+FAST_START = True
 # --------------------------------------------------
 
+KEYS = ("toggle", "client1", "client2")
+LED_PINS = (BOARD_LED_TOGGLE, BOARD_LED_CLIENT1, BOARD_LED_CLIENT2)  # por id de clave
+
+TS_MAX = 2**63  # los ts se guardan en array("q")
+
+def _as_ts(v):
+    """ts de un snapshot/state.json como int en [0, 2**63), o None si no es válido."""
+    if isinstance(v, bool):
+        return None
+    try:
+        ts = int(v)
+    except (TypeError, ValueError, OverflowError):
+        return None
+    return ts if 0 <= ts < TS_MAX else None
+
 # Estado local (espejo con timestamps)
-state = {
-    "toggle": False,
-    "client1": False,
-    "client2": False,
-    "ts": {"toggle": 0, "client1": 0, "client2": 0}
-}
-lock = threading.RLock()
+class _State:
+    """
+    Valor y ts de cada clave en arrays indexados por id de clave, con máscara
+    de claves pendientes de guardar. Los lectores usan snapshot(): una tupla
+    inmutable (valores, ts) que se sustituye entera en cada cambio, sin lock.
+    """
+    __slots__ = ("keys", "ids", "val", "ts", "dirty", "_lock", "_snap", "_merged")
+
+    def __init__(self, keys):
+        self.keys = tuple(keys)
+        self.ids = {k: i for i, k in enumerate(self.keys)}
+        self.val = array("b", bytes(len(self.keys)))
+        self.ts = array("q", [0] * len(self.keys))
+        self.dirty = 0          # bit i = clave i cambiada desde el último state_save
+        self._lock = threading.Lock()
+        self._merged = None     # último snapshot del servidor aplicado (con 304 llega el mismo objeto)
+        self._publish()
+
+    def _publish(self):
+        self._snap = (tuple(self.val), tuple(self.ts))
+
+    def snapshot(self):
+        """(valores, ts) coherentes entre sí, por id de clave."""
+        return self._snap
+
+    def get(self, key: str) -> bool:
+        return bool(self._snap[0][self.ids[key]])
+
+    def ts_of(self, key: str) -> int:
+        return self._snap[1][self.ids[key]]
+
+    def toggle(self, key: str, ts_ms: int) -> bool:
+        i = self.ids[key]
+        with self._lock:
+            self.val[i] = 0 if self.val[i] else 1
+            self.ts[i] = ts_ms
+            self.dirty |= 1 << i
+            self._publish()
+            return bool(self.val[i])
+
+    def load(self, data: dict):
+        ts_in = data.get("ts")
+        if not isinstance(ts_in, dict):
+            ts_in = {}
+        with self._lock:
+            for i, k in enumerate(self.keys):
+                if k in data:
+                    self.val[i] = 1 if data[k] else 0
+                ts = _as_ts(ts_in.get(k))
+                if ts is not None:
+                    self.ts[i] = ts
+            self._publish()
+
+    def merge(self, snap: dict):
+        """
+        Aplica un snapshot del servidor (LWW por ts) en una pasada sobre sus
+        claves. Devuelve (máscara de claves cambiadas, máscara de claves con
+        versión remota más nueva). Las entradas con ts no válido se ignoran.
+        """
+        if snap is self._merged:
+            return 0, 0
+        ts_in = snap.get("ts")
+        if not isinstance(ts_in, dict):
+            return 0, 0
+        ids, val, ts = self.ids, self.val, self.ts
+        changed = newer = 0
+        with self._lock:
+            for k, s_ts in ts_in.items():
+                i = ids.get(k)
+                if i is None:
+                    continue
+                s_ts = _as_ts(s_ts)
+                if s_ts is None or s_ts < ts[i]:
+                    continue
+                nv = 1 if snap.get(k) else 0
+                if s_ts > ts[i]:
+                    newer |= 1 << i
+                elif nv == val[i]:
+                    continue
+                val[i] = nv
+                ts[i] = s_ts
+                changed |= 1 << i
+            if changed:
+                self.dirty |= changed
+                self._publish()
+            self._merged = snap
+        return changed, newer
+
+    def take_dirty(self):
+        """Devuelve (máscara sucia, snapshot) y limpia la máscara."""
+        with self._lock:
+            dirty, self.dirty = self.dirty, 0
+            return dirty, self._snap
+
+    def mark_dirty(self, mask: int):
+        with self._lock:
+            self.dirty |= mask
+
+    def to_dict(self, snap=None) -> dict:
+        """Formato de state.json (el mismo que el del servidor)."""
+        vals, tss = snap or self._snap
+        data = {k: bool(vals[i]) for i, k in enumerate(self.keys)}
+        data["ts"] = {k: tss[i] for i, k in enumerate(self.keys)}
+        return data
+
+state = _State(KEYS)
+gpio = GpioManager()
+_led_lock = threading.Lock()
+_save_lock = threading.Lock()
 
 _server_online_lock = threading.Lock()
 _last_server_ok_monotonic = 0.0  # instante (time.monotonic) del último GET exitoso
 
+# ---- Línea de tiempo de arranque (time-to-interactive) ----
+_boot_marks = {}
+_boot_marks_lock = threading.Lock()
+
+def boot_mark(name: str):
+    """Registra (una sola vez) el instante de un hito de arranque relativo a _T0."""
+    with _boot_marks_lock:
+        if name in _boot_marks:
+            return
+        ms = (time.monotonic() - _T0) * 1000.0
+        _boot_marks[name] = ms
+    print(f"[BOOT] +{ms:7.1f} ms {name}", flush=True)
+
+boot_mark("import")
+
+# ---- Contadores de telemetría (baratos: se actualizan aunque no haya servidor) ----
+_loops = {}                         # nombre del bucle -> telemetry.LoopStats
+_http_stats = telemetry.HttpStats()
+_io_stats = {"state_writes": 0, "state_bytes": 0}
+
+# ---- Trazas de cambios (spans JSON-lines, both/scripts/common.py) ----
+_spans = SpanWriter(TRACE_FILE, NODE_ID)
+
+def new_change_id() -> str:
+    return f"{NODE_ID}-{int(time.time() * 1000)}-{os.urandom(3).hex()}"
+
+def trace_span(hop: str, cid: str, key: str, dur_ms: float = None, **extra):
+    """Añade una línea {t, node, hop, cid, key, ...} a TRACE_FILE (si TRACE_ENABLED)."""
+    if TRACE_ENABLED:
+        _spans.write(hop, cid, key, dur_ms, **extra)
+
 # ---- GPIO ----
 def gpio_setup():
-    GPIO.setwarnings(False)
-    GPIO.setmode(GPIO.BOARD)
     # LEDs
-    GPIO.setup(BOARD_LED_TOGGLE,  GPIO.OUT, initial=GPIO.LOW)
-    GPIO.setup(BOARD_LED_CLIENT1, GPIO.OUT, initial=GPIO.LOW)
-    GPIO.setup(BOARD_LED_CLIENT2, GPIO.OUT, initial=GPIO.LOW)
-    GPIO.setup(BOARD_LED_SERVERONLINE, GPIO.OUT, initial=GPIO.LOW)
-    GPIO.setup(BOARD_LED_INTERNET, GPIO.OUT, initial=GPIO.LOW)
+    gpio.setup_output(BOARD_LED_TOGGLE)
+    gpio.setup_output(BOARD_LED_CLIENT1)
+    gpio.setup_output(BOARD_LED_CLIENT2)
+    gpio.setup_output(BOARD_LED_SERVERONLINE)
+    gpio.setup_output(BOARD_LED_INTERNET)
     # Botones (pull-up => reposo 1, pulsado 0)
-    GPIO.setup(BOARD_BTN_TOGGLE,  GPIO.IN, pull_up_down=GPIO.PUD_UP)
-    GPIO.setup(BOARD_BTN_CLIENT1, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-    GPIO.setup(BOARD_BTN_CLIENT2, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+    gpio.setup_input(BOARD_BTN_TOGGLE)
+    gpio.setup_input(BOARD_BTN_CLIENT1)
+    gpio.setup_input(BOARD_BTN_CLIENT2)
 
 def leds_apply():
-    with lock:
-        GPIO.output(BOARD_LED_TOGGLE,  GPIO.HIGH if state["toggle"]  else GPIO.LOW)
-        GPIO.output(BOARD_LED_CLIENT1, GPIO.HIGH if state["client1"] else GPIO.LOW)
-        GPIO.output(BOARD_LED_CLIENT2, GPIO.HIGH if state["client2"] else GPIO.LOW)
+    # el gestor GPIO solo escribe los pines que cambian (y en bloque por tick)
+    with _led_lock:
+        vals, _ts = state.snapshot()
+        gpio.set_many(dict(zip(LED_PINS, vals)))
 
 # ---- Persistencia local (opcional) ----
 def state_dir_prepare():
@@ -74,29 +255,30 @@ def state_load():
         if STATE_FILE.exists():
             data = json.loads(STATE_FILE.read_text(encoding="utf-8"))
             if isinstance(data, dict):
-                with lock:
-                    for k in ("toggle", "client1", "client2"):
-                        state[k] = bool(data.get(k, state[k]))
-                    ts_in = data.get("ts", {})
-                    for k in ("toggle", "client1", "client2"):
-                        state["ts"][k] = int(ts_in.get(k, state["ts"][k]))
+                state.load(data)
     except Exception as e:
         print("[WARN] state_load:", e, flush=True)
     leds_apply()
 
 def state_save():
-    tmp = STATE_FILE.with_suffix(".tmp")
-    try:
-        tmp.write_text(json.dumps(state, ensure_ascii=False), encoding="utf-8")
-        tmp.replace(STATE_FILE)
-    except Exception as e:
-        print("[WARN] state_save:", e, flush=True)
-
-# ---- Server base URL ----
-def read_server_base():
-    if not SERVER_TXT.exists():
-        return None
-    raw = SERVER_TXT.read_text(encoding="utf-8").strip()
+    """Escribe state.json solo si hay claves sucias (en una SD cada escritura cuenta)."""
+    with _save_lock:
+        dirty, snap = state.take_dirty()
+        if not dirty:
+            return
+        tmp = STATE_FILE.with_suffix(".tmp")
+        try:
+            data = json.dumps(state.to_dict(snap), ensure_ascii=False).encode("utf-8")
+            tmp.write_bytes(data)
+            tmp.replace(STATE_FILE)
+            _io_stats["state_writes"] += 1
+            _io_stats["state_bytes"] += len(data)
+        except Exception as e:
+            state.mark_dirty(dirty)
+            print("[WARN] state_save:", e, flush=True)
+
+# ---- Server base URLs ----
+def _normalize_base(raw: str):
     if "://" not in raw:
         raw = "https://" + raw
     u = urlparse(raw)
@@ -104,39 +286,191 @@ def read_server_base():
     if scheme not in ("http", "https"):
         scheme = "https"
     host = u.netloc or u.path
-    return f"{scheme}://{host}"
+    return f"{scheme}://{host}" if host else None
+
+_server_txt_cache = {"mtime": None, "bases": []}
+
+def read_server_bases():
+    """
+    Lee server.txt: una URL por línea (o separadas por comas/espacios),
+    '#' para comentarios. Se cachea por mtime para no leer disco en cada GET.
+    """
+    try:
+        mtime = SERVER_TXT.stat().st_mtime
+    except OSError:
+        return []
+    if mtime == _server_txt_cache["mtime"]:
+        return _server_txt_cache["bases"]
+    bases = []
+    for line in SERVER_TXT.read_text(encoding="utf-8").splitlines():
+        line = line.split("#", 1)[0]
+        for raw in line.replace(",", " ").split():
+            base = _normalize_base(raw)
+            if base and base not in bases:
+                bases.append(base)
+    _server_txt_cache["mtime"] = mtime
+    _server_txt_cache["bases"] = bases
+    return bases
+
+class _Endpoint:
+    """Latencias recientes de un endpoint (segundos; los fallos cuentan como HTTP_TIMEOUT)."""
+    def __init__(self, base):
+        self.base = base
+        self.samples = deque(maxlen=LATENCY_WINDOW)
+        self.fails = 0
+        self._lock = threading.Lock()
+
+    def record_ok(self, dt: float):
+        with self._lock:
+            self.samples.append(dt)
+            self.fails = 0
+
+    def record_fail(self):
+        with self._lock:
+            self.samples.append(HTTP_TIMEOUT)
+            self.fails += 1
+
+    def quantile(self, q: float):
+        """Cuantil q de las latencias recientes (s), o None sin muestras."""
+        with self._lock:
+            xs = sorted(self.samples)
+        if not xs:
+            return None
+        return xs[min(len(xs) - 1, int(q * len(xs)))]
+
+    def rank_key(self):
+        # primero los que no están fallando; sin muestras = 0 para que se exploren
+        median = self.quantile(0.5)
+        return (self.fails > 0, median if median is not None else 0.0)
+
+    def hedge_delay(self) -> float:
+        """Cuánto esperar antes de duplicar la petición en el siguiente endpoint (su p95)."""
+        if len(self.samples) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_SEC
+        return min(HTTP_TIMEOUT, max(HEDGE_MIN_SEC, self.quantile(0.95)))
+
+_endpoints = {}  # base -> _Endpoint (se conserva al editar server.txt)
+_endpoints_lock = threading.Lock()
+_http_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="HTTP")
+
+def endpoints_ranked():
+    """Endpoints de server.txt ordenados del más rápido al más lento."""
+    bases = read_server_bases()
+    with _endpoints_lock:
+        eps = [_endpoints.setdefault(b, _Endpoint(b)) for b in bases]
+    return sorted(eps, key=_Endpoint.rank_key)
 
 # ---- REST helpers ----
-def get_state():
-    base = read_server_base()
-    if not base: return None
+_requests_mod = None
+
+def _http():
+    """Módulo 'requests', importado la primera vez que se necesita (fuera del arranque)."""
+    global _requests_mod
+    if _requests_mod is None:
+        import requests
+        _requests_mod = requests
+    return _requests_mod
+
+def _state_path():
+    q = []
+    if SUBSCRIBE_KEYS:
+        q.append("keys=" + ",".join(SUBSCRIBE_KEYS))
+    if SUBSCRIBE_PREFIXES:
+        q.append("prefix=" + ",".join(SUBSCRIBE_PREFIXES))
+    return "/api/state" + ("?" + "&".join(q) if q else "")
+
+# (ETag, snapshot) de la última respuesta completa: el ETag depende solo del
+# contenido, así que vale para cualquier endpoint del mismo servidor
+_last_snap = (None, None)
+
+def _timed_get(ep: _Endpoint, path: str):
+    global _last_snap
+    t0 = time.monotonic()
+    etag, cached = _last_snap
+    headers = {"If-None-Match": etag} if etag else {}
+    status, data = None, None
     try:
-        r = requests.get(f"{base}/api/state", timeout=HTTP_TIMEOUT)
-        if r.ok:
-            return r.json()
+        r = _http().get(f"{ep.base}{path}", timeout=HTTP_TIMEOUT, headers=headers)
+        status = r.status_code
+        if status == 304 and cached is not None:
+            data = cached
+        elif r.ok:
+            data = r.json()
+            _last_snap = (r.headers.get("ETag"), data)
     except Exception:
         pass
+    # se cuenta una sola vez, con el resultado ya conocido (JSON roto o 304 sin caché = error)
+    dt = time.monotonic() - t0
+    _http_stats.record("GET", dt, status, error=data is None)
+    if data is None:
+        ep.record_fail()
+    else:
+        ep.record_ok(dt)
+    return data
+
+def get_state():
+    """
+    GET /api/state al endpoint más rápido. Si no responde dentro de su p95
+    se lanza un duplicado al siguiente (hedging); si falla, se pasa al siguiente
+    sin esperar. Gana la primera respuesta válida.
+    """
+    eps = endpoints_ranked()
+    if not eps:
+        return None
+    path = _state_path()
+    pending = {_http_pool.submit(_timed_get, eps[0], path)}
+    nxt = 1
+    hedge_at = time.monotonic() + eps[0].hedge_delay()
+    while pending:
+        timeout = max(0.0, hedge_at - time.monotonic()) if nxt < len(eps) else None
+        done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        for f in done:
+            snap = f.result()
+            if snap is not None:
+                return snap
+        if nxt < len(eps) and (done or time.monotonic() >= hedge_at):
+            pending.add(_http_pool.submit(_timed_get, eps[nxt], path))
+            hedge_at = time.monotonic() + eps[nxt].hedge_delay()
+            nxt += 1
     return None
 
-def put_key(key: str, value: bool, ts_ms: int):
-    base = read_server_base()
-    if not base:
+def put_key(key: str, value: bool, ts_ms: int, cid: str = None):
+    # Las escrituras no se duplican: se prueban en orden de latencia (failover)
+    eps = endpoints_ranked()
+    if not eps:
         print(f"[HTTP] base URL vacía", flush=True)
         return False
-    try:
-        r = requests.put(
-            f"{base}/api/state/{key}",
-            json={"value": bool(value), "ts": int(ts_ms)},
-            timeout=HTTP_TIMEOUT
-        )
-        print(f"[HTTP] PUT {key}={value} ts={ts_ms} -> {r.status_code} {r.text[:120]}", flush=True)
-        return r.ok
-    except Exception as e:
-        print(f"[HTTP] EXC {key}: {e}", flush=True)
-        return False
+    body = {"value": bool(value), "ts": int(ts_ms)}
+    if cid:
+        body["cid"] = cid
+    for ep in eps:
+        t0 = time.monotonic()
+        try:
+            r = _http().put(
+                f"{ep.base}/api/state/{key}",
+                json=body,
+                timeout=HTTP_TIMEOUT
+            )
+            _http_stats.record("PUT", time.monotonic() - t0, r.status_code)
+            print(f"[HTTP] PUT {ep.base} {key}={value} ts={ts_ms} -> {r.status_code} {r.text[:120]}", flush=True)
+            trace_span("put", cid, key, (time.monotonic() - t0) * 1000.0,
+                       endpoint=ep.base, status=r.status_code)
+            if r.ok:
+                ep.record_ok(time.monotonic() - t0)
+                return True
+            if r.status_code < 500:
+                return False  # el servidor rechazó la petición: otro endpoint dirá lo mismo
+        except Exception as e:
+            _http_stats.record("PUT", time.monotonic() - t0)
+            print(f"[HTTP] EXC {ep.base} {key}: {e}", flush=True)
+            trace_span("put", cid, key, (time.monotonic() - t0) * 1000.0,
+                       endpoint=ep.base, status=None)
+        ep.record_fail()
+    return False
 
 # --- Reconciliación local → servidor tras recuperar conexión ---
 _last_pushed = {"toggle": 0, "client1": 0, "client2": 0}
+_local_cid = {}  # key -> change ID de la última pulsación local (para reenvíos)
 
 def reconcile_with_server(snap: dict):
     """
@@ -146,15 +480,22 @@ def reconcile_with_server(snap: dict):
     if not snap: 
         return
     to_push = []
-    with lock:
-        for key in ("toggle", "client1", "client2"):
-            s_ts = int(snap.get("ts", {}).get(key, 0))
-            l_ts = int(state["ts"].get(key, 0))
-            if l_ts > s_ts and l_ts != _last_pushed.get(key, 0):
-                to_push.append((key, state[key], l_ts))
-
-    for key, val, ts_ms in to_push:
-        ok = put_key(key, val, ts_ms)
+    vals, tss = state.snapshot()
+    # solo las claves que manda el servidor (las suscritas)
+    ts_in = snap.get("ts")
+    if not isinstance(ts_in, dict):
+        return
+    for key, s_ts in ts_in.items():
+        i = state.ids.get(key)
+        s_ts = _as_ts(s_ts)
+        if i is None or s_ts is None:
+            continue
+        l_ts = tss[i]
+        if l_ts > s_ts and l_ts != _last_pushed.get(key, 0):
+            to_push.append((key, bool(vals[i]), l_ts, _local_cid.get(key)))
+
+    for key, val, ts_ms, cid in to_push:
+        ok = put_key(key, val, ts_ms, cid)
         if ok:
             _last_pushed[key] = ts_ms
 
@@ -166,71 +507,67 @@ class _BtnWatcher(threading.Thread):
         self.pin = pin
         self.on_press = on_press_callback
         self._last_change_ms = self._now_ms()
-        self._last_stable = GPIO.input(self.pin)  # 1=libre, 0=pulsado
+        self._last_stable = gpio.read(self.pin)  # 1=libre, 0=pulsado
+        self.stats = _loops[name] = telemetry.LoopStats(POLL_BTN_MS / 1000.0)
 
     def _now_ms(self): return int(time.time() * 1000)
 
     def run(self):
         while True:
-            level = GPIO.input(self.pin)
+            t0 = time.monotonic()
+            level = gpio.read(self.pin)
             now_ms = self._now_ms()
             if level != self._last_stable:
                 if (now_ms - self._last_change_ms) >= DEBOUNCE_MS:
                     self._last_stable = level
                     self._last_change_ms = now_ms
-                    if level == GPIO.LOW:
+                    if level == 0:
                         print(f"[{self.name}] PRESS pin={self.pin}", flush=True)
                         try:
                             self.on_press(now_ms)
                         except Exception as e:
                             print(f"[{self.name}] error callback:", e, flush=True)
+            # la pulsación hace el PUT en este hilo: es un overrun esperado
+            self.stats.tick(time.monotonic() - t0)
             time.sleep(POLL_BTN_MS / 1000.0)
 
 # callbacks de botones
-def on_press_toggle(ts_ms: int):
-    print(f"[CALL] toggle -> value will be {not state['toggle']} ts={ts_ms}", flush=True)
-    with lock:
-        state["toggle"] = not state["toggle"]
-        state["ts"]["toggle"] = ts_ms
-        state_save()
+def _on_press(key: str, ts_ms: int):
+    cid = new_change_id()
+    trace_span("press", cid, key, t_press=ts_ms)
+    value = state.toggle(key, ts_ms)
+    _local_cid[key] = cid
+    print(f"[CALL] {key} -> value {value} ts={ts_ms}", flush=True)
+    state_save()
     leds_apply()
+    trace_span("local_apply", cid, key, time.time() * 1000 - ts_ms)
     # llamada directa (sin hilo) para ver el log [HTTP]
-    put_key("toggle", state["toggle"], ts_ms)
+    put_key(key, value, ts_ms, cid)
+
+def on_press_toggle(ts_ms: int):
+    _on_press("toggle", ts_ms)
 
 def on_press_client1(ts_ms: int):
-    print(f"[CALL] client1 -> value will be {not state['client1']} ts={ts_ms}", flush=True)
-    with lock:
-        state["client1"] = not state["client1"]
-        state["ts"]["client1"] = ts_ms
-        state_save()
-    leds_apply()
-    # llamada directa con cabecera
-    put_key("client1", state["client1"], ts_ms)
+    _on_press("client1", ts_ms)
 
 def on_press_client2(ts_ms: int):
-    print(f"[CALL] client2 -> value will be {not state['client2']} ts={ts_ms}", flush=True)
-    with lock:
-        state["client2"] = not state["client2"]
-        state["ts"]["client2"] = ts_ms
-        state_save()
-    leds_apply()
-    put_key("client2", state["client2"], ts_ms)
+    _on_press("client2", ts_ms)
 
 def merge_from_server_snapshot(snap: dict):
     if not snap: 
         return False
-    changed = False
-    with lock:
-        for k in ("toggle","client1","client2"):
-            s_ts = int(snap.get("ts", {}).get(k, 0))
-            if s_ts >= state["ts"].get(k, 0):
-                nv = bool(snap.get(k, False))
-                if nv != state[k]:
-                    changed = True
-                state[k] = nv
-                state["ts"][k] = s_ts
+    changed, newer = state.merge(snap)
+    # con 304 el snapshot es el mismo: ni state.json ni LEDs se tocan
+    if changed:
         state_save()
-    leds_apply()
+        leds_apply()
+    if newer:
+        cids = snap.get("cid")
+        if not isinstance(cids, dict):
+            cids = {}
+        for i, k in enumerate(state.keys):
+            if newer >> i & 1:
+                trace_span("client_apply", cids.get(k), k)
     return True
 
 def initial_sync(timeout_sec=5.0):
@@ -240,6 +577,7 @@ def initial_sync(timeout_sec=5.0):
         snap = get_state()
         if snap and merge_from_server_snapshot(snap):
             print("[SYNC] initial server snapshot applied", flush=True)
+            boot_mark("first_sync")
             global _last_server_ok_monotonic
             with _server_online_lock:
                 _last_server_ok_monotonic = time.monotonic()
@@ -252,42 +590,54 @@ def initial_sync(timeout_sec=5.0):
 
 # ---- Hilo de sincronización ----
 class SyncLoop(threading.Thread):
+    def __init__(self):
+        super().__init__(daemon=True, name="SYNC")
+        self._stop_evt = threading.Event()
+        self.stats = _loops["SYNC"] = telemetry.LoopStats(PULL_INTERVAL)
+
+    def stop(self):
+        self._stop_evt.set()
+
     def run(self):
-        # Espera opcional al boot-ready
-        for _ in range(200):
-            if BOOT_READY_FLAG.exists():
-                break
-            time.sleep(0.1)
+        # Espera opcional al boot-ready. En FAST_START no se espera: el .path
+        # de systemd ya garantiza /run/boot-ready y sincronizar cuanto antes es
+        # justo lo que se busca.
+        if not FAST_START:
+            for _ in range(200):
+                if BOOT_READY_FLAG.exists():
+                    break
+                time.sleep(0.1)
 
         global _last_server_ok_monotonic
 
-        while True:
-            snap = get_state()
-            if snap:
-                # 1) aplica servidor → local (LWW)
-                merge_from_server_snapshot(snap)
-                with _server_online_lock:
-                    _last_server_ok_monotonic = time.monotonic()
-                # 2) empuja local → servidor si local era más nuevo (offline edits)
-                reconcile_with_server(snap)
-            time.sleep(PULL_INTERVAL)
-
-class ServerOnlineLedLoop(threading.Thread):
-    def __init__(self, on_timeout_sec=5.0, period=0.5):
-        super().__init__(daemon=True, name="LED_SERVER_ONLINE")
+        while not self._stop_evt.is_set():
+            t0 = time.monotonic()
+            try:
+                snap = get_state()
+                if isinstance(snap, dict):
+                    # 1) aplica servidor → local (LWW)
+                    merge_from_server_snapshot(snap)
+                    boot_mark("first_sync")
+                    with _server_online_lock:
+                        _last_server_ok_monotonic = time.monotonic()
+                    # 2) empuja local → servidor si local era más nuevo (offline edits)
+                    reconcile_with_server(snap)
+            except Exception as e:
+                # un snapshot raro no puede matar el hilo (systemd no lo vería: el proceso sigue vivo)
+                print("[WARN] sync:", e, flush=True)
+            self.stats.tick(time.monotonic() - t0)
+            self._stop_evt.wait(PULL_INTERVAL)
+
+class ServerOnlineLed:
+    """Tarea periódica del planificador GPIO (no bloquea): LED on si hubo un GET OK reciente."""
+    def __init__(self, on_timeout_sec=5.0):
         self.on_timeout_sec = float(on_timeout_sec)  # cuánto dura “OK” tras el último GET exitoso
-        self.period = float(period)
 
-    def run(self):
-        while True:
-            now = time.monotonic()
-            with _server_online_lock:
-                last_ok = _last_server_ok_monotonic
-            is_ok = (now - last_ok) <= self.on_timeout_sec
-            GPIO.output(BOARD_LED_SERVERONLINE, GPIO.HIGH if is_ok else GPIO.LOW)
-            time.sleep(self.period)
-
-import socket
+    def __call__(self):
+        now = time.monotonic()
+        with _server_online_lock:
+            last_ok = _last_server_ok_monotonic
+        gpio.set(BOARD_LED_SERVERONLINE, (now - last_ok) <= self.on_timeout_sec)
 
 class InternetLedLoop(threading.Thread):
     """
@@ -301,6 +651,7 @@ class InternetLedLoop(threading.Thread):
         self.alive_window_sec = float(alive_window_sec)
         self.timeout = float(timeout)
         self._last_ok_monotonic = 0.0
+        self.stats = _loops["LED_INTERNET"] = telemetry.LoopStats(self.period)
 
     def _probe(self) -> bool:
         try:
@@ -311,28 +662,69 @@ class InternetLedLoop(threading.Thread):
 
     def run(self):
         while True:
+            t0 = time.monotonic()
             # Probar conexión
             if self._probe():
                 self._last_ok_monotonic = time.monotonic()
 
             # Decidir LED con ventana de vida para evitar parpadeos
             is_ok = (time.monotonic() - self._last_ok_monotonic) <= self.alive_window_sec
-            GPIO.output(BOARD_LED_INTERNET, GPIO.HIGH if is_ok else GPIO.LOW)
+            gpio.set(BOARD_LED_INTERNET, is_ok)
 
+            self.stats.tick(time.monotonic() - t0)
             time.sleep(self.period)
 
 
+# ---- Telemetría ----
+def telemetry_snapshot() -> dict:
+    """Lo que devuelve GET /stats."""
+    loops = {name: st.to_dict() for name, st in list(_loops.items())}
+    loops["GPIO_SCHED"] = {
+        "iterations": gpio.steps,
+        "overruns": gpio.overruns,
+        "budget_ms": round(gpio.tick * 1000.0, 3),
+        "max_ms": round(gpio.step_max * 1000.0, 3),
+    }
+    with _endpoints_lock:
+        eps = list(_endpoints.values())
+    ms = lambda v: None if v is None else round(v * 1000.0, 1)
+    return {
+        "node": NODE_ID,
+        "uptime_s": round(time.monotonic() - _T0, 1),
+        "boot_ms": dict(_boot_marks),
+        "process_cpu_s": round(time.process_time(), 3),
+        "thread_cpu_s": telemetry.thread_cpu(),
+        "loops": loops,
+        "gpio": {"writes": gpio.writes, "skipped": gpio.skipped},
+        "http": _http_stats.to_dict(),
+        "endpoints": [{"base": ep.base, "fails": ep.fails,
+                       "p50_ms": ms(ep.quantile(0.5)), "p95_ms": ms(ep.quantile(0.95))}
+                      for ep in eps],
+        "io": dict(_io_stats, trace_bytes=_spans.bytes_written, proc=telemetry.process_io()),
+    }
+
+
 # ---- Main / señales ----
 def main():
     gpio_setup()
+    gpio.start()
+    boot_mark("gpio_setup")
     state_dir_prepare()
-    state_load()
-    initial_sync(timeout_sec=5.0)
+    state_load()  # aplica LEDs con el último estado conocido
+    boot_mark("first_led")
+    if TELEMETRY_PORT:
+        try:
+            telemetry.serve(TELEMETRY_PORT, telemetry_snapshot)
+        except OSError as e:
+            print("[WARN] telemetry:", e, flush=True)
+    if not FAST_START:
+        initial_sync(timeout_sec=5.0)
     try:
         _BtnWatcher(BOARD_BTN_TOGGLE,  on_press_toggle,  name="BTN_TOGGLE").start()
         _BtnWatcher(BOARD_BTN_CLIENT1, on_press_client1, name="BTN_CLIENT1").start()
         _BtnWatcher(BOARD_BTN_CLIENT2, on_press_client2, name="BTN_CLIENT2").start()
-        ServerOnlineLedLoop(on_timeout_sec=5.0, period=0.5).start()
+        boot_mark("buttons_live")
+        gpio.every(0.5, ServerOnlineLed(on_timeout_sec=5.0))
         InternetLedLoop(period=2.0, alive_window_sec=5.0, timeout=1.5).start()
         SyncLoop().start()
         while True:
@@ -341,13 +733,13 @@ def main():
         pass
     finally:
         try:
-            GPIO.cleanup()
+            gpio.close()
         except Exception:
             pass
 
 def shutdown(signum, frame):
     try:
-        GPIO.cleanup()
+        gpio.close()
     except Exception:
         pass
     sys.exit(0)
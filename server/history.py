@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+"""
+Histórico de transiciones de estado en disco.
+
+- Registros binarios de tamaño fijo (REC_SIZE bytes) en segmentos
+  preasignados y mapeados en memoria (history/seg-<recno inicial>.bin).
+- Índice en memoria por clave: nº de registro ordenado por ts (8 B por
+  transición, la mitad que el propio registro) + tiempo ON acumulado cada
+  CUM_EVERY entradas. ts y valor se leen del mmap, así que un rango es una
+  búsqueda binaria y el tiempo ON entre dos instantes son dos búsquedas más
+  como mucho CUM_EVERY lecturas cada una (sin recorrer el histórico).
+- Retención acotada por tamaño: al superar max_bytes se borra el segmento
+  más antiguo y se recortan sus entradas del índice (solo se relee un bloque).
+- Al abrir solo se mapean los segmentos y se localiza el final (búsqueda
+  binaria); el índice se construye en segundo plano por tramos, así que
+  las escrituras funcionan desde el primer momento y las consultas esperan
+  a ready().
+"""
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+import mmap, os, struct, threading, time
+
+# ts_ms (int64), key_id (uint8), value (uint8), valid (uint8), relleno
+REC = struct.Struct("<qBBB5x")
+REC_SIZE = REC.size                 # 16 bytes
+VALID_OFFSET = 10                   # byte 'valid' dentro del registro
+SEGMENT_RECORDS = 65536             # 1 MiB por segmento
+LOAD_CHUNK = 1024                   # registros indexados por cada toma del lock al cargar
+LOAD_PAUSE_SEC = 0.001              # pausa entre tramos: la carga no compite con las peticiones
+CUM_EVERY = 64                      # entradas del índice por punto de control del ON acumulado
+
+
+class _KeyIndex:
+    """
+    Transiciones de una clave ordenadas por ts. Solo guarda el nº de registro
+    de cada una (8 B); ts y valor se leen del mmap con read(recno). El tiempo
+    ON acumulado se guarda cada CUM_EVERY entradas y el resto se suma al consultar.
+    """
+    def __init__(self, read):
+        self._read = read           # recno -> (ts, valor)
+        self.recno = array("q")
+        # cum[b]: ms ON acumulados hasta la primera entrada del bloque b. Solo
+        # importan las diferencias: tras desalojar un segmento cum[0] ya no es 0
+        self.cum = array("q")
+        self.off = 0                # entradas recortadas por delante (alinea los bloques)
+        self.ordered = True         # recno creciente en el orden del índice
+        self._last = None           # (ts, valor, ON acumulado) de la última entrada
+
+    # ---- bloques de CUM_EVERY entradas (el primero puede ser más corto) ----
+    def _block(self, p: int) -> int:
+        return (p + self.off) // CUM_EVERY - self.off // CUM_EVERY
+
+    def _start(self, b: int) -> int:
+        return max(0, (self.off // CUM_EVERY + b) * CUM_EVERY - self.off)
+
+    def _cum_at(self, p: int) -> int:
+        """ms ON acumulados hasta la entrada p (como mucho CUM_EVERY lecturas)."""
+        b = self._block(p)
+        c = self.cum[b]
+        j = self._start(b)
+        ts, val = self._read(self.recno[j])
+        while j < p:
+            j += 1
+            nts, nval = self._read(self.recno[j])
+            if val:
+                c += nts - ts
+            ts, val = nts, nval
+        return c
+
+    def _rebuild_from(self, i: int):
+        """Recalcula los puntos de control a partir del bloque de la entrada i."""
+        b = max(self._block(i) - 1, 0)   # el bloque anterior no ha cambiado
+        del self.cum[b + 1:]
+        p = self._start(b)
+        c = self.cum[b]
+        ts, val = self._read(self.recno[p])
+        for p in range(p + 1, len(self.recno)):
+            nts, nval = self._read(self.recno[p])
+            if val:
+                c += nts - ts
+            ts, val = nts, nval
+            if (p + self.off) % CUM_EVERY == 0:
+                self.cum.append(c)
+        self._last = (ts, val, c)
+
+    def _bisect(self, t: int, right: bool) -> int:
+        """Nº de entradas con ts < t (ts <= t si right)."""
+        lo, hi = 0, len(self.recno)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            ts = self._read(self.recno[mid])[0]
+            if ts < t or (right and ts == t):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def add(self, ts: int, recno: int, value: bool):
+        """Añade una transición (los recno llegan siempre crecientes)."""
+        n = len(self.recno)
+        last = self._last
+        if n == 0 or ts >= last[0]:
+            # caso normal (llegan en orden por ts): O(1), sin leer el mmap
+            if n == 0:
+                self.off, c = 0, 0
+                del self.cum[:]
+            else:
+                c = last[2] + (ts - last[0] if last[1] else 0)
+            self.recno.append(recno)
+            if n == 0 or (n + self.off) % CUM_EVERY == 0:
+                self.cum.append(c)
+            self._last = (ts, value, c)
+            return
+        i = self._bisect(ts, right=True)
+        self.recno.insert(i, recno)
+        self.ordered = False
+        self._rebuild_from(i)
+
+    def trim_before(self, cutoff: int):
+        """
+        Quita las entradas de registros desalojados (recno < cutoff). Llamar
+        antes de cerrar sus segmentos: se leen para rehacer el primer bloque.
+        """
+        if self.ordered:
+            # caso normal: son un prefijo; los puntos de control siguientes siguen valiendo
+            i = bisect_left(self.recno, cutoff)
+            if not i:
+                return
+            if i == len(self.recno):
+                del self.recno[:], self.cum[:]
+                self.off, self._last = 0, None
+                return
+            c = self._cum_at(i)
+            del self.cum[:self._block(i)]
+            self.cum[0] = c
+            del self.recno[:i]
+            self.off += i
+            return
+        self.recno = array("q", (r for r in self.recno if r >= cutoff))
+        self.off = 0
+        self.cum = array("q", [0] if self.recno else [])
+        if self.recno:
+            self._rebuild_from(0)
+        else:
+            self._last = None
+        self.ordered = all(self.recno[j - 1] < self.recno[j] for j in range(1, len(self.recno)))
+
+    def bisect_left(self, t: int) -> int:
+        return self._bisect(t, right=False)
+
+    def bisect_right(self, t: int) -> int:
+        return self._bisect(t, right=True)
+
+    def value_at(self, t: int):
+        """Valor vigente en t (None si no hay registros anteriores)."""
+        i = self._bisect(t, right=True) - 1
+        return None if i < 0 else bool(self._read(self.recno[i])[1])
+
+    def on_until(self, t: int) -> int:
+        """ms ON acumulados desde el primer registro hasta t."""
+        i = self._bisect(t, right=True) - 1
+        if i < 0:
+            return self.cum[0] if self.cum else 0
+        ts, val = self._read(self.recno[i])
+        return self._cum_at(i) + (t - ts if val else 0)
+
+
+class HistoryStore:
+    def __init__(self, root: Path, keys, max_bytes: int = 32 * 1024 * 1024,
+                 segment_records: int = SEGMENT_RECORDS, background: bool = True):
+        self.root = Path(root)
+        self.keys = tuple(keys)
+        self.key_ids = {k: i for i, k in enumerate(self.keys)}
+        self.max_bytes = int(max_bytes)
+        self.segment_records = int(segment_records)
+        self._lock = threading.Lock()
+        self._segments = []         # [(base_recno, path, fh, mmap)] del más antiguo al más nuevo
+        self._next_recno = 0
+        self._index = {k: _KeyIndex(self._ts_val) for k in self.keys}
+        self._scan_pos = 0          # registros < _scan_pos ya están en el índice
+        self._ready = threading.Event()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._open_existing()
+        if background:
+            # con gevent (gunicorn -k gevent) este hilo es un greenlet
+            threading.Thread(target=self._load, daemon=True, name="HISTORY_LOAD").start()
+        else:
+            self._load()
+
+    # ---- segmentos ----
+    def _open_segment(self, base: int):
+        path = self.root / f"seg-{base:012d}.bin"
+        fh = open(path, "a+b")
+        size = self.segment_records * REC_SIZE
+        if os.fstat(fh.fileno()).st_size < size:
+            fh.truncate(size)
+        mm = mmap.mmap(fh.fileno(), size)
+        self._segments.append((base, path, fh, mm))
+        return mm
+
+    def _open_existing(self):
+        """Mapea los segmentos y localiza el final sin leer los registros."""
+        bases = sorted(int(p.stem.split("-", 1)[1]) for p in self.root.glob("seg-*.bin"))
+        for base in bases:
+            self._open_segment(base)
+        if not self._segments:
+            self._open_segment(0)
+        # los registros se escriben en orden: los válidos de un segmento son un
+        # prefijo, y solo el último segmento puede estar a medias
+        base, _path, _fh, mm = self._segments[-1]
+        lo, hi = 0, self.segment_records
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if mm[mid * REC_SIZE + VALID_OFFSET]:
+                lo = mid + 1
+            else:
+                hi = mid
+        self._next_recno = base + lo
+        self._scan_pos = self._segments[0][0]
+
+    def _index_records(self, lo: int, hi: int):
+        """Añade al índice los registros [lo, hi). Llamar con _lock tomado."""
+        keys, nkeys = self.keys, len(self.keys)
+        for base, _path, _fh, mm in self._segments:
+            end = base + self.segment_records
+            if end <= lo or base >= hi:
+                continue
+            a, b = max(lo, base), min(hi, end)
+            recno = a
+            for ts, kid, val, valid in REC.iter_unpack(mm[(a - base) * REC_SIZE:(b - base) * REC_SIZE]):
+                if not valid:
+                    break
+                if kid < nkeys:
+                    self._index[keys[kid]].add(ts, recno, bool(val))
+                recno += 1
+
+    def _load(self):
+        """
+        Construye el índice por tramos de LOAD_CHUNK registros, soltando el
+        lock entre tramos para que append() no espere. Lo que se escriba
+        mientras tanto queda por detrás de _next_recno y lo indexa este bucle.
+        """
+        while True:
+            with self._lock:
+                self._catch_up()
+                if self._scan_pos >= self._next_recno:
+                    self._ready.set()
+                    return
+                end = min(self._next_recno, self._scan_pos + LOAD_CHUNK)
+                self._index_records(self._scan_pos, end)
+                self._scan_pos = end
+            time.sleep(LOAD_PAUSE_SEC)  # cede el turno (con gevent, a las peticiones)
+
+    def ready(self) -> bool:
+        """True cuando el índice está completo (las consultas no esperan)."""
+        return self._ready.is_set()
+
+    def _evict_if_needed(self):
+        seg_bytes = self.segment_records * REC_SIZE
+        n = len(self._segments)
+        while n > 1 and n * seg_bytes > self.max_bytes:
+            n -= 1
+        drop = len(self._segments) - n
+        if not drop:
+            return
+        # el índice se recorta antes de cerrar: necesita leer el bloque que se parte
+        cutoff = self._segments[drop][0]
+        for idx in self._index.values():
+            idx.trim_before(cutoff)
+        self._scan_pos = max(self._scan_pos, cutoff)
+        for _base, path, fh, mm in self._segments[:drop]:
+            mm.close()
+            fh.close()
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+        del self._segments[:drop]
+
+    def _catch_up(self):
+        """
+        Indexa registros que haya añadido otro proceso sobre los mismos
+        segmentos (el otro worker durante un reload de gunicorn). Mientras
+        el índice se está cargando solo avanza _next_recno: _load() los indexa.
+        """
+        while True:
+            base, _path, _fh, mm = self._segments[-1]
+            slot = self._next_recno - base
+            if slot >= self.segment_records:
+                if not (self.root / f"seg-{self._next_recno:012d}.bin").exists():
+                    return
+                self._open_segment(self._next_recno)
+                self._evict_if_needed()
+                continue
+            ts, kid, val, valid = REC.unpack_from(mm, slot * REC_SIZE)
+            if not valid:
+                return
+            if kid < len(self.keys) and self._ready.is_set():
+                self._index[self.keys[kid]].add(ts, self._next_recno, bool(val))
+            self._next_recno += 1
+
+    # ---- escritura ----
+    def append(self, key: str, value: bool, ts: int):
+        """
+        Añade una transición y devuelve su nº de registro (creciente y común a
+        todos los procesos; el llamador debe serializar con flock).
+        """
+        kid = self.key_ids.get(key)
+        if kid is None:
+            return None
+        with self._lock:
+            self._catch_up()
+            base, _path, _fh, mm = self._segments[-1]
+            slot = self._next_recno - base
+            if slot >= self.segment_records:
+                mm = self._open_segment(self._next_recno)
+                base, slot = self._next_recno, 0
+                self._evict_if_needed()
+            REC.pack_into(mm, slot * REC_SIZE, int(ts), kid, 1 if value else 0, 1)
+            if self._ready.is_set():
+                self._index[key].add(int(ts), self._next_recno, value)
+            self._next_recno += 1
+            return self._next_recno - 1
+
+    def head(self) -> int:
+        """Nº del último registro escrito (por cualquier proceso); -1 si no hay ninguno."""
+        with self._lock:
+            self._catch_up()
+            return self._next_recno - 1
+
+    def close(self):
+        with self._lock:
+            for _base, _path, fh, mm in self._segments:
+                mm.flush()
+                mm.close()
+                fh.close()
+            self._segments = []
+
+    # ---- consultas ----
+    def _read(self, recno: int):
+        # los segmentos son consecutivos: el que toca se calcula sin buscarlo
+        i = (recno - self._segments[0][0]) // self.segment_records
+        if 0 <= i < len(self._segments) and self._segments[i][0] <= recno:
+            base, _path, _fh, mm = self._segments[i]
+        else:
+            # hueco (un segmento borrado a mano): búsqueda lineal
+            for base, _path, _fh, mm in reversed(self._segments):
+                if recno >= base:
+                    break
+            else:
+                return None
+        return REC.unpack_from(mm, (recno - base) * REC_SIZE)
+
+    def _ts_val(self, recno: int):
+        rec = self._read(recno)
+        return rec[0], rec[2]
+
+    def range(self, key: str, t_from: int, t_to: int, limit: int = 1000):
+        """Transiciones de key con t_from <= ts <= t_to (las primeras 'limit')."""
+        self._ready.wait()
+        with self._lock:
+            self._catch_up()
+            idx = self._index.get(key)
+            if idx is None:
+                return None, []
+            lo = idx.bisect_left(t_from)
+            hi = min(idx.bisect_right(t_to), lo + limit)
+            items = []
+            for i in range(lo, hi):
+                rec = self._read(idx.recno[i])
+                if rec is not None:
+                    items.append({"ts": rec[0], "value": bool(rec[2])})
+            return idx.value_at(t_from - 1), items
+
+    def on_time(self, key: str, t_from: int, t_to: int) -> int:
+        """ms que key estuvo ON en [t_from, t_to)."""
+        self._ready.wait()
+        with self._lock:
+            self._catch_up()
+            idx = self._index.get(key)
+            if idx is None:
+                return 0
+            return max(0, idx.on_until(t_to) - idx.on_until(t_from))
+
+    def on_time_per_day(self, key: str, t_from: int, t_to: int):
+        """[(AAAA-MM-DD, ms ON)] por día local del servidor dentro de [t_from, t_to)."""
+        out = []
+        day = time.localtime(t_from / 1000.0)
+        start = int(time.mktime((day.tm_year, day.tm_mon, day.tm_mday, 0, 0, 0, 0, 0, -1)) * 1000)
+        while start < t_to:
+            nd = time.localtime(start / 1000.0 + 36 * 3600)  # +36 h cae siempre en el día siguiente (DST)
+            end = int(time.mktime((nd.tm_year, nd.tm_mon, nd.tm_mday, 0, 0, 0, 0, 0, -1)) * 1000)
+            lo, hi = max(start, t_from), min(end, t_to)
+            out.append((time.strftime("%Y-%m-%d", time.localtime(start / 1000.0)), self.on_time(key, lo, hi)))
+            start = end
+        return out
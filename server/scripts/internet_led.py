@@ -1,9 +1,12 @@
 #!/usr/bin/env python3
-import RPi.GPIO as GPIO
 import socket
 import time
 import signal
 import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "both" / "scripts"))
+from gpio_manager import GpioManager
 
 # --- Configuración ---
 LED_PIN = 16             # Modo BOARD: pin físico 16
@@ -16,6 +19,8 @@ TARGETS = [              # destinos para probar conectividad (TCP)
     ("208.67.222.222", 53),  # OpenDNS
 ]
 
+gpio = None
+
 def check_internet() -> bool:
     """Devuelve True si se puede abrir TCP a alguno de los objetivos."""
     for host, port in TARGETS:
@@ -28,15 +33,15 @@ def check_internet() -> bool:
 
 def cleanup(*_):
     try:
-        GPIO.output(LED_PIN, GPIO.LOW)
-        GPIO.cleanup()
+        if gpio is not None:
+            gpio.close()  # LED a LOW y libera solo nuestro pin
     finally:
         sys.exit(0)
 
 def main():
-    GPIO.setwarnings(False)
-    GPIO.setmode(GPIO.BOARD)  # usamos numeración física
-    GPIO.setup(LED_PIN, GPIO.OUT, initial=GPIO.LOW)
+    global gpio
+    gpio = GpioManager()
+    gpio.setup_output(LED_PIN)
 
     # Salida limpia con Ctrl+C o `systemctl stop` (SIGTERM)
     signal.signal(signal.SIGINT, cleanup)
@@ -45,8 +50,8 @@ def main():
     last_state = None
     while True:
         online = check_internet()
+        gpio.set(LED_PIN, online)  # el gestor ignora escrituras repetidas
         if online != last_state:
-            GPIO.output(LED_PIN, GPIO.HIGH if online else GPIO.LOW)
             print(f"[{time.strftime('%H:%M:%S')}] Internet {'ONLINE' if online else 'OFFLINE'}; LED {'ON' if online else 'OFF'}")
             last_state = online
         time.sleep(CHECK_INTERVAL)
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Banco de pruebas local del reload de toggle.service.
+
+Arranca gunicorn como run.sh (gevent, 1 worker) en un puerto libre y con un
+directorio de datos temporal (TOGGLE_DATA_DIR), mete carga de GET/PUT como
+la de los clientes y, cada --every segundos, hace:
+
+  --mode reload   SIGHUP al maestro (lo que hace 'systemctl reload')
+  --mode restart  SIGTERM + arranque nuevo (lo que hacía 'try-restart')
+
+Informa de peticiones fallidas, latencias (global y en la ventana de 1 s
+tras cada reload/restart) y escrituras perdidas: el estado final debe
+coincidir con el último PUT confirmado de cada clave.
+
+--seed-history N escribe antes N MiB de histórico (segmentos llenos), para
+medir el reload con un histórico como el de producción y no vacío.
+
+Uso:
+  reload_bench.py --mode reload --duration 20
+  reload_bench.py --mode reload --seed-history 40
+  reload_bench.py --mode restart
+"""
+import argparse, os, shutil, signal, subprocess, sys, tempfile, threading, time
+from pathlib import Path
+
+import requests
+
+SERVER_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(SERVER_DIR))
+sys.path.insert(0, str(SERVER_DIR.parent / "both" / "scripts"))
+from history import REC, REC_SIZE, SEGMENT_RECORDS  # noqa: E402
+from common import free_port, percentile  # noqa: E402
+
+KEYS = ("toggle", "client1", "client2")
+
+
+def seed_history(data_dir, mib):
+    """Escribe segmentos llenos con transiciones alternas de las tres claves (ts del pasado)."""
+    hist = data_dir / "history"
+    hist.mkdir(parents=True, exist_ok=True)
+    n_seg = max(1, int(mib * 1024 * 1024) // (SEGMENT_RECORDS * REC_SIZE))
+    t0 = int(time.time() * 1000) - n_seg * SEGMENT_RECORDS * 1000
+    for s in range(n_seg):
+        base = s * SEGMENT_RECORDS
+        buf = bytearray(SEGMENT_RECORDS * REC_SIZE)
+        for j in range(SEGMENT_RECORDS):
+            r = base + j
+            REC.pack_into(buf, j * REC_SIZE, t0 + r * 1000, r % len(KEYS), (r // len(KEYS)) % 2, 1)
+        (hist / f"seg-{base:012d}.bin").write_bytes(buf)
+    return n_seg * SEGMENT_RECORDS
+
+
+def start_gunicorn(gunicorn, port, data_dir):
+    env = dict(os.environ, TOGGLE_DATA_DIR=str(data_dir))
+    proc = subprocess.Popen(
+        [gunicorn, "-k", "gevent", "-w", "1", "--graceful-timeout", "10",
+         "-b", f"127.0.0.1:{port}", "server:app"],
+        cwd=SERVER_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    t0 = time.monotonic()
+    while time.monotonic() - t0 < 15:
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/api/state", timeout=0.5).ok:
+                return proc
+        except requests.RequestException:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError("gunicorn did not come up")
+
+
+class Load:
+    def __init__(self, base, timeout):
+        self.base, self.timeout = base, timeout
+        self.lock = threading.Lock()
+        self.samples = []           # (t_inicio_monotonic, latencia_ms, ok)
+        self.acked = {}             # key -> (ts, value) del último PUT confirmado
+        self.stop = threading.Event()
+        self._ts = int(time.time() * 1000)
+
+    def _next_ts(self):
+        with self.lock:
+            self._ts += 1
+            return self._ts
+
+    def worker(self, i):
+        n = 0
+        while not self.stop.is_set():
+            n += 1
+            t0 = time.monotonic()
+            ok = False
+            try:
+                # un solo hilo escribe cada clave: el orden de los PUT es el de sus ts
+                # (el servidor sobrescribe sin comparar ts)
+                if i < len(KEYS) and n % 2 == 0:
+                    key = KEYS[i]
+                    ts, val = self._next_ts(), bool((n // 2) % 2)
+                    r = requests.put(f"{self.base}/api/state/{key}",
+                                     json={"value": val, "ts": ts}, timeout=self.timeout)
+                    ok = r.ok
+                    if ok:
+                        with self.lock:
+                            if ts > self.acked.get(key, (0, None))[0]:
+                                self.acked[key] = (ts, val)
+                else:
+                    ok = requests.get(f"{self.base}/api/state", timeout=self.timeout).ok
+            except requests.RequestException:
+                ok = False
+            with self.lock:
+                self.samples.append((t0, (time.monotonic() - t0) * 1000.0, ok))
+            time.sleep(0.01)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Peticiones fallidas y latencia durante reload/restart del servidor")
+    ap.add_argument("--mode", choices=("reload", "restart"), default="reload")
+    ap.add_argument("--duration", type=float, default=20.0)
+    ap.add_argument("--every", type=float, default=4.0, help="segundos entre reloads")
+    ap.add_argument("--clients", type=int, default=20, help="hilos de carga")
+    ap.add_argument("--timeout", type=float, default=1.0, help="timeout HTTP (como HTTP_TIMEOUT del cliente)")
+    ap.add_argument("--gunicorn", default=shutil.which("gunicorn") or "gunicorn")
+    ap.add_argument("--seed-history", type=float, default=0.0, metavar="MIB",
+                    help="MiB de histórico previo (por defecto vacío)")
+    args = ap.parse_args()
+
+    data_dir = Path(tempfile.mkdtemp(prefix="reload-bench-"))
+    if args.seed_history > 0:
+        n = seed_history(data_dir, args.seed_history)
+        print(f"histórico sembrado: {n} registros", flush=True)
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    proc = start_gunicorn(args.gunicorn, port, data_dir)
+    load = Load(base, args.timeout)
+    threads = [threading.Thread(target=load.worker, args=(i,), daemon=True) for i in range(args.clients)]
+    events = []
+    try:
+        for t in threads:
+            t.start()
+        t_end = time.monotonic() + args.duration
+        next_evt = time.monotonic() + args.every
+        while time.monotonic() < t_end:
+            time.sleep(max(0.0, min(next_evt, t_end) - time.monotonic()))
+            if time.monotonic() >= next_evt and time.monotonic() < t_end:
+                events.append(time.monotonic())
+                if args.mode == "reload":
+                    proc.send_signal(signal.SIGHUP)
+                else:
+                    proc.terminate()
+                    proc.wait(timeout=15)
+                    proc = start_gunicorn(args.gunicorn, port, data_dir)
+                next_evt += args.every
+        load.stop.set()
+        for t in threads:
+            t.join(timeout=args.timeout + 1)
+        time.sleep(0.5)
+        final = requests.get(f"{base}/api/state", timeout=2).json()
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    lat = [ms for _t, ms, ok in load.samples if ok]
+    failed = sum(1 for _t, _ms, ok in load.samples if not ok)
+    window = [ms for t, ms, ok in load.samples if ok and any(e <= t < e + 1.0 for e in events)]
+    lost = [k for k, (ts, val) in load.acked.items()
+            if int(final["ts"][k]) != ts or bool(final[k]) != val]
+
+    fmt = lambda v: "-" if v is None else f"{v:.1f}"
+    print(f"modo: {args.mode}  eventos: {len(events)}  peticiones: {len(load.samples)}  fallidas: {failed}")
+    print(f"latencia ms (todas)        p50 {fmt(percentile(lat, 0.5))}  p99 {fmt(percentile(lat, 0.99))}"
+          f"  max {fmt(max(lat) if lat else None)}")
+    print(f"latencia ms (1 s tras evento) p50 {fmt(percentile(window, 0.5))}  p99 {fmt(percentile(window, 0.99))}"
+          f"  max {fmt(max(window) if window else None)}")
+    print(f"escrituras confirmadas perdidas: {len(lost)} {lost if lost else ''}")
+    sys.exit(1 if failed or lost else 0)
+
+
+if __name__ == "__main__":
+    main()
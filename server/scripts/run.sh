@@ -14,4 +14,6 @@ source .venv/bin/activate
 
 # arrancar con gunicorn + gevent (1 worker es suficiente)
 # app = objeto Flask en server/server.py
-exec gunicorn -k gevent -w 1 -b 127.0.0.1:5000 server:app
\ No newline at end of file
+# SIGHUP (systemctl reload toggle.service) = workers nuevos sin soltar el socket;
+# los viejos tienen --graceful-timeout para terminar lo que estén atendiendo
+exec gunicorn -k gevent -w 1 --graceful-timeout 10 -b 127.0.0.1:5000 server:app
\ No newline at end of file
@@ -1,9 +1,12 @@
 #!/usr/bin/env python3
-import RPi.GPIO as GPIO
 import time
 import subprocess
 import signal
 import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "both" / "scripts"))
+from gpio_manager import GpioManager
 
 # ---------- Config ----------
 LED_PIN = 18                 # BOARD 18 (GPIO24) -> LED "server" (estado UP/DOWN)
@@ -11,13 +14,15 @@ SERVICE_NAME = "toggle.service"
 CHECK_SVC_EVERY = 1.0        # s: frecuencia de chequeo del servicio
 # ----------------------------
 
+gpio = None
+
 def led_setup():
-    GPIO.setwarnings(False)
-    GPIO.setmode(GPIO.BOARD)
-    GPIO.setup(LED_PIN, GPIO.OUT, initial=GPIO.LOW)
+    global gpio
+    gpio = GpioManager()
+    gpio.setup_output(LED_PIN)
 
 def led_on(on: bool):
-    GPIO.output(LED_PIN, GPIO.HIGH if on else GPIO.LOW)
+    gpio.set(LED_PIN, on)
 
 def service_is_active(name: str) -> bool:
     # systemctl is-active --quiet devuelve 0 si está "active"
@@ -28,8 +33,8 @@ def service_is_active(name: str) -> bool:
 
 def cleanup(*_):
     try:
-        led_on(False)
-        GPIO.cleanup()
+        if gpio is not None:
+            gpio.close()  # LED a LOW y libera solo nuestro pin
     finally:
         sys.exit(0)
 
@@ -38,21 +43,10 @@ def main():
     signal.signal(signal.SIGTERM, cleanup)
     led_setup()
 
-    last_svc_state = None
-    next_check = 0.0
-
+    # Chequeo periódico del estado del servicio; led_on() no reescribe si no cambia
     while True:
-        now = time.monotonic()
-
-        # Chequeo periódico del estado del servicio
-        if now >= next_check:
-            next_check = now + CHECK_SVC_EVERY
-            svc_on = service_is_active(SERVICE_NAME)
-            if svc_on != last_svc_state:
-                led_on(svc_on)   # ON si servicio activo, OFF si no
-                last_svc_state = svc_on
-
-        time.sleep(0.05)  # pequeño respiro del bucle
+        led_on(service_is_active(SERVICE_NAME))   # ON si servicio activo, OFF si no
+        time.sleep(CHECK_SVC_EVERY)
 
 if __name__ == "__main__":
     try:
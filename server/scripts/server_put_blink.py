@@ -1,31 +1,35 @@
 #!/usr/bin/env python3
-import time, sys, signal
+import sys, signal
 from pathlib import Path
-import RPi.GPIO as GPIO
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "both" / "scripts"))
+from gpio_manager import GpioManager
 
 # --- Config ---
 PIN_ACTIVITY = 38           # BOARD 38 (GPIO20)
 ON_TIME_SEC  = 0.5          # encendido breve
 # --------------
 
+gpio = None
+
 def cleanup(*_):
     try:
-        GPIO.output(PIN_ACTIVITY, GPIO.LOW)
-        GPIO.cleanup()
+        if gpio is not None:
+            gpio.close()
     finally:
         sys.exit(0)
 
 def main():
+    global gpio
     signal.signal(signal.SIGINT, cleanup)
     signal.signal(signal.SIGTERM, cleanup)
 
-    GPIO.setwarnings(False)
-    GPIO.setmode(GPIO.BOARD)
-    GPIO.setup(PIN_ACTIVITY, GPIO.OUT, initial=GPIO.LOW)
+    gpio = GpioManager()
+    gpio.setup_output(PIN_ACTIVITY)
 
-    GPIO.output(PIN_ACTIVITY, GPIO.HIGH)
-    time.sleep(ON_TIME_SEC)
-    GPIO.output(PIN_ACTIVITY, GPIO.LOW)
+    # el planificador del gestor apaga el LED al acabar el pulso
+    gpio.pulse(PIN_ACTIVITY, ON_TIME_SEC).wait()
+    gpio.close()
 
 if __name__ == "__main__":
     try:
@@ -1,40 +1,79 @@
 #!/usr/bin/env python3
-from flask import Flask, jsonify, request, render_template
+from flask import Flask, Response, jsonify, request, render_template
 from pathlib import Path
-import json, time, threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+import json, time, threading, os, socket, fcntl, hashlib, queue, sys
+
+from history import HistoryStore
 
 # === RUTAS BASE ===
 APP_ROOT = Path(__file__).resolve().parent          # .../server
-STATE_FILE = APP_ROOT / "state.json"                # .../server/state.json
+_SHARED = str(APP_ROOT.parent / "both" / "scripts")  # utilidades compartidas con el cliente
+if _SHARED not in sys.path:
+    sys.path.insert(0, _SHARED)
+from common import SpanWriter  # noqa: E402
+
+# Datos (estado, trazas, histórico); TOGGLE_DATA_DIR permite aislarlos (simulador, pruebas)
+DATA_DIR = Path(os.environ.get("TOGGLE_DATA_DIR") or APP_ROOT)
+STATE_FILE = DATA_DIR / "state.json"                # .../server/state.json
+LOCK_FILE = DATA_DIR / "state.lock"                 # flock entre procesos (reload de gunicorn)
+TRACE_FILE = DATA_DIR / "trace.jsonl"               # spans de propagación de cambios
+HISTORY_DIR = DATA_DIR / "history"                  # segmentos binarios del histórico
+# Retención del histórico: se borra el segmento más antiguo. Cuesta RAM: el
+# índice ocupa ~8 B por transición (la mitad del disco), por worker y el doble
+# mientras conviven dos workers en un reload -> 32 MiB = ~2M transiciones,
+# ~16 MiB de índice por worker; la carga en segundo plano tarda ~4 s en x86
+# (varias veces más en una Pi Zero)
+HISTORY_MAX_BYTES = 32 * 1024 * 1024
+HISTORY_MAX_ITEMS = 10000                           # tope de transiciones por respuesta
+HISTORY_TS_MAX = 253402300799999                    # 9999-12-31 23:59:59.999 UTC: from/to de consultas
+
+SUBSCRIPTIONS_MAX = 256                             # suscripciones distintas en caché (LRU)
+
+# Stream SSE (/api/stream)
+STREAM_RING = 256                                   # eventos recientes para reanudar con Last-Event-ID
+STREAM_QUEUE_MAX = 64                               # eventos en cola por conexión (navegador lento)
+STREAM_MAX_CONNS = 200                              # conexiones abiertas a la vez
+STREAM_HEARTBEAT_SEC = 15                           # comentario ': ping' si no hay eventos
+STREAM_REFRESH_SEC = 1.0                            # comprobación de cambios de otro worker (reload)
+
+TRACE_ENABLED = True
+NODE_ID = socket.gethostname()
 
 # --- Estado in-memory ---
+# Claves conocidas: de aquí salen los defaults, los validadores, el índice de
+# suscripciones y el histórico. Las nuevas van al final: el histórico guarda
+# la posición de la clave en esta tupla
+KEYS = ("toggle", "client1", "client2")
+
 DEFAULT_STATE = {
-    "toggle": False,
-    "client1": False,
-    "client2": False,
-    "ts": {
-        "toggle": 0,
-        "client1": 0,
-        "client2": 0
-    }
+    **{k: False for k in KEYS},
+    "ts": {k: 0 for k in KEYS},
+    # change ID del último cambio de cada clave (trazas extremo a extremo)
+    "cid": {}
 }
 
 _state_lock = threading.Lock()
 _state = None  # se carga desde disco o DEFAULT_STATE
+_state_stamp = None  # (inode, mtime) de state.json cuando se leyó/escribió por última vez
+_lock_fh = None
 
 
 def _safe_merge_defaults(data: dict) -> dict:
     if not isinstance(data, dict):
         data = {}
     # valores por defecto
-    for k in ("toggle", "client1", "client2"):
+    for k in KEYS:
         data.setdefault(k, False)
     ts = data.get("ts")
     if not isinstance(ts, dict):
         ts = {}
-    for k in ("toggle", "client1", "client2"):
+    for k in KEYS:
         ts.setdefault(k, 0)
     data["ts"] = ts
+    if not isinstance(data.get("cid"), dict):
+        data["cid"] = {}
     return data
 
 
@@ -42,10 +81,239 @@ def _now_ts() -> int:
     return int(time.time() * 1000)
 
 
+_spans = SpanWriter(TRACE_FILE, NODE_ID)
+
+
+def trace_span(hop: str, cid: str, key: str, dur_ms: float = None, **extra):
+    """Añade un span JSON-lines {t, node, hop, cid, key, ...} a TRACE_FILE."""
+    if TRACE_ENABLED:
+        _spans.write(hop, cid, key, dur_ms, **extra)
+
+
+def _file_stamp():
+    try:
+        st = STATE_FILE.stat()
+        return (st.st_ino, st.st_mtime_ns)
+    except OSError:
+        return None
+
+
+@contextmanager
+def _cross_process_lock():
+    """
+    Durante un reload (SIGHUP a gunicorn) el worker saliente termina sus
+    peticiones en curso mientras el nuevo ya atiende: ambos escriben
+    state.json, así que las escrituras se serializan con flock.
+    """
+    global _lock_fh
+    if _lock_fh is None:
+        _lock_fh = open(LOCK_FILE, "a")
+    fcntl.flock(_lock_fh, fcntl.LOCK_EX)
+    try:
+        yield
+    finally:
+        fcntl.flock(_lock_fh, fcntl.LOCK_UN)
+
+
+def _refresh_if_stale():
+    """
+    Relee state.json si lo escribió otro proceso (el otro worker durante un
+    reload). state.json se escribe antes de responder a cada PUT, así que es
+    un diario siempre al día. Llamar con _state_lock tomado.
+    """
+    global _state, _state_stamp
+    stamp = _file_stamp()
+    if stamp is None or stamp == _state_stamp:
+        return
+    try:
+        _state = _safe_merge_defaults(json.loads(STATE_FILE.read_text(encoding="utf-8")))
+        _state_stamp = stamp
+        _invalidate_all()
+        # no sabemos qué cambió el otro proceso: los streams se resincronizan
+        _stream.resync(_history.head())
+    except Exception:
+        pass  # si no se puede leer, seguimos con lo que hay en memoria
+
+
+# --- Suscripciones (clave o prefijo) con índice clave -> suscriptores ---
+class _Subscription:
+    """Conjunto de claves/prefijos; guarda la respuesta ya codificada y su ETag."""
+    __slots__ = ("keys", "prefixes", "body", "etag")
+
+    def __init__(self, keys, prefixes):
+        self.keys = frozenset(keys)
+        self.prefixes = tuple(prefixes)
+        self.body = None   # bytes JSON; None = hay que regenerarlo
+        self.etag = None
+
+    def matches(self, key: str) -> bool:
+        if not self.keys and not self.prefixes:
+            return True  # sin filtro = todas las claves
+        return key in self.keys or any(key.startswith(p) for p in self.prefixes)
+
+
+_subs = OrderedDict()   # spec -> _Subscription (orden LRU)
+_subs_by_key = {}       # key -> {spec, ...}
+
+
+def _get_subscription(keys, prefixes) -> _Subscription:
+    """Devuelve (o registra) la suscripción; la comparten todos los clientes con el mismo conjunto."""
+    spec = ",".join(sorted(keys)) + "|" + ",".join(sorted(prefixes))
+    sub = _subs.get(spec)
+    if sub is not None:
+        _subs.move_to_end(spec)
+        return sub
+    sub = _subs[spec] = _Subscription(keys, prefixes)
+    for k in KEYS:
+        if sub.matches(k):
+            _subs_by_key.setdefault(k, set()).add(spec)
+    if len(_subs) > SUBSCRIPTIONS_MAX:
+        old_spec, _old = _subs.popitem(last=False)
+        for specs in _subs_by_key.values():
+            specs.discard(old_spec)
+    return sub
+
+
+def _fanout(key: str):
+    """Tras cambiar key, invalida solo las suscripciones interesadas en ella."""
+    for spec in _subs_by_key.get(key, ()):
+        _subs[spec].body = None
+
+
+def _invalidate_all():
+    for sub in _subs.values():
+        sub.body = None
+
+
+def _encode_for(sub: _Subscription):
+    """Snapshot filtrado (mismo formato que el estado completo) y su ETag por contenido."""
+    ks = [k for k in KEYS if sub.matches(k)]
+    snap = {k: _state[k] for k in ks}
+    snap["ts"] = {k: _state["ts"][k] for k in ks}
+    snap["cid"] = {k: _state["cid"][k] for k in ks if k in _state["cid"]}
+    sub.body = json.dumps(snap, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    # ETag por contenido (no por contador) para que valga entre workers durante un reload
+    sub.etag = '"' + hashlib.blake2b(sub.body, digest_size=8).hexdigest() + '"'
+
+
+# --- Stream SSE: un único emisor para todas las conexiones ---
+class _StreamConn:
+    """Una conexión SSE: filtro de claves y cola acotada."""
+    def __init__(self, keys, prefixes):
+        self.keys, self.prefixes = keys, prefixes
+        self.filter = _Subscription(keys, prefixes)  # solo para matches()
+        self.q = queue.Queue(maxsize=STREAM_QUEUE_MAX)
+        self.lagged = False     # se perdieron eventos: toca mandar un snapshot
+
+
+class _Broadcaster:
+    """
+    Los PUT publican aquí (con _state_lock tomado, así el orden de la cola
+    es el de los commits). Cada evento va a la cola de cada conexión sin
+    bloquear; si una cola está llena se vacía y la conexión recibe un
+    snapshot en su lugar, de modo que un navegador lento no retiene memoria.
+    Los ids son el nº de registro del histórico, comunes a los workers.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ring = deque()    # (id, key, data) de los últimos STREAM_RING eventos
+        self._floor = None      # ids > _floor están todos en el anillo
+        self._conns = set()
+        self._watcher = None
+
+    def publish(self, eid: int, key: str, data: str):
+        with self._lock:
+            if self._floor is None:
+                self._floor = eid - 1
+            self._ring.append((eid, key, data))
+            if len(self._ring) > STREAM_RING:
+                self._floor = self._ring.popleft()[0]
+            conns = list(self._conns)
+        for c in conns:
+            if c.filter.matches(key):
+                self._offer(c, (eid, "change", data))
+
+    def resync(self, eid: int):
+        """El estado cambió por otra vía: el anillo deja de valer y todos reciben snapshot."""
+        with self._lock:
+            self._ring.clear()
+            self._floor = eid
+            conns = list(self._conns)
+        for c in conns:
+            c.lagged = True
+            self._offer(c, None)
+
+    def _offer(self, conn: _StreamConn, item):
+        try:
+            conn.q.put_nowait(item)
+        except queue.Full:
+            conn.lagged = True
+            while True:
+                try:
+                    conn.q.get_nowait()
+                except queue.Empty:
+                    break
+            conn.q.put_nowait(None)  # despierta al generador para que mande el snapshot
+
+    def subscribe(self, conn: _StreamConn, last_id, head: int):
+        """Registra la conexión. Devuelve los eventos a reenviar, o None si hace falta snapshot."""
+        with self._lock:
+            if len(self._conns) >= STREAM_MAX_CONNS:
+                return False
+            self._conns.add(conn)
+            if self._floor is None:
+                self._floor = head
+            self._start_watcher()
+            if last_id is None or last_id < self._floor or last_id > head:
+                return None
+            return [(eid, "change", data) for eid, key, data in self._ring
+                    if eid > last_id and conn.filter.matches(key)]
+
+    def unsubscribe(self, conn: _StreamConn):
+        with self._lock:
+            self._conns.discard(conn)
+
+    def _start_watcher(self):
+        # con gevent (gunicorn -k gevent) este hilo es un greenlet
+        if self._watcher is None or not self._watcher.is_alive():
+            self._watcher = threading.Thread(target=self._watch, daemon=True, name="STREAM_WATCH")
+            self._watcher.start()
+
+    def _watch(self):
+        """Mientras haya streams, detecta escrituras del otro worker (durante un reload)."""
+        while True:
+            time.sleep(STREAM_REFRESH_SEC)
+            with self._lock:
+                if not self._conns:
+                    self._watcher = None
+                    return
+            with _state_lock:
+                _refresh_if_stale()
+
+
+_stream = _Broadcaster()
+
+
+def _sse(eid, event: str, data) -> str:
+    if isinstance(data, bytes):
+        data = data.decode("utf-8")
+    return f"id: {eid}\nevent: {event}\ndata: {data}\n\n"
+
+
+def _write_state_file():
+    """Escritura atómica (.tmp + replace). Llamar con _state_lock y _cross_process_lock."""
+    global _state_stamp
+    tmp = STATE_FILE.with_suffix(".tmp")
+    tmp.write_text(json.dumps(_state, ensure_ascii=False, indent=2), encoding="utf-8")
+    tmp.replace(STATE_FILE)
+    _state_stamp = _file_stamp()
+
+
 def load_state():
     """Carga estado desde disco; si está corrupto, hace backup y usa defaults."""
-    global _state
+    global _state, _state_stamp
     with _state_lock:
+        _state_stamp = _file_stamp()
         try:
             if STATE_FILE.exists():
                 data = json.loads(STATE_FILE.read_text(encoding="utf-8"))
@@ -64,10 +332,8 @@ def load_state():
 
 def save_state():
     """Escritura atómica: primero .tmp y luego replace."""
-    with _state_lock:
-        tmp = STATE_FILE.with_suffix(".tmp")
-        tmp.write_text(json.dumps(_state, ensure_ascii=False, indent=2), encoding="utf-8")
-        tmp.replace(STATE_FILE)
+    with _state_lock, _cross_process_lock():
+        _write_state_file()
 
 
 app = Flask(
@@ -78,6 +344,7 @@ app = Flask(
 
 # Carga estado al arrancar módulo (Flask 3 ya no tiene before_first_request)
 load_state()
+_history = HistoryStore(HISTORY_DIR, KEYS, max_bytes=HISTORY_MAX_BYTES)
 
 
 # --- Rutas HTML ---
@@ -87,16 +354,33 @@ def page_index():
 
 
 # --- API REST ---
+def _split_arg(name: str, limit: int = 64):
+    raw = request.args.get(name, "")
+    return [x.strip().lower() for x in raw.split(",") if x.strip()][:limit]
+
+
 @app.get("/api/state")
 def api_get_state():
+    """
+    Estado completo, o solo las claves suscritas con ?keys=a,b y/o ?prefix=client.
+    Responde 304 si el cliente manda If-None-Match con el ETag vigente.
+    """
+    keys, prefixes = _split_arg("keys"), _split_arg("prefix")
     with _state_lock:
-        return jsonify(_state)
+        _refresh_if_stale()
+        sub = _get_subscription(keys, prefixes)
+        if sub.body is None:
+            _encode_for(sub)
+        body, etag = sub.body, sub.etag
+    if etag in request.headers.get("If-None-Match", ""):
+        return Response(status=304, headers={"ETag": etag})
+    return Response(body, mimetype="application/json", headers={"ETag": etag})
 
 
 @app.put("/api/state/<key>")
 def api_put_key(key):
     key = key.strip().lower()
-    if key not in ("toggle", "client1", "client2"):
+    if key not in KEYS:
         return jsonify({"error": "unknown key"}), 400
 
     body = request.get_json(silent=True) or {}
@@ -108,17 +392,159 @@ def api_put_key(key):
         ts = int(body.get("ts", _now_ts()))
     except Exception:
         ts = _now_ts()
+    # el histórico y los clientes guardan ts como int64: fuera de rango se rechaza
+    # antes de tocar el estado
+    if not 0 <= ts < 2**63:
+        return jsonify({"error": "'ts' out of range (0 <= ts < 2**63)"}), 400
+    # los clientes mandan su change ID; el dashboard web no, así que se genera aquí
+    cid = str(body.get("cid") or f"{NODE_ID}-web-{_now_ts()}-{os.urandom(3).hex()}")[:80]
+    t_recv = time.monotonic()
+    trace_span("server_recv", cid, key, remote=request.remote_addr)
 
-    with _state_lock:
+    with _state_lock, _cross_process_lock():
+        _refresh_if_stale()
         _state[key] = val
         _state["ts"][key] = ts
+        _state["cid"][key] = cid
+        _fanout(key)
         # guardado atómico
-        tmp = STATE_FILE.with_suffix(".tmp")
-        tmp.write_text(json.dumps(_state, ensure_ascii=False, indent=2), encoding="utf-8")
-        tmp.replace(STATE_FILE)
+        t_write = time.monotonic()
+        _write_state_file()
+        now = time.monotonic()
+        trace_span("server_commit", cid, key, (now - t_recv) * 1000.0,
+                   write_ms=round((now - t_write) * 1000.0, 3))
+        eid = _history.append(key, val, ts)
+        _stream.publish(eid, key, json.dumps({"key": key, "value": val, "ts": ts, "cid": cid},
+                                             ensure_ascii=False, separators=(",", ":")))
         return jsonify(_state), 200
 
 
+@app.get("/api/stream")
+def api_stream():
+    """
+    Server-Sent Events con los cambios (admite ?keys= / ?prefix= como /api/state).
+    Eventos 'snapshot' (estado completo filtrado) y 'change' ({key, value, ts, cid}),
+    con id para reanudar: el navegador manda Last-Event-ID al reconectar y recibe
+    lo que se perdió (o un snapshot si ya no está en el anillo).
+    """
+    keys, prefixes = _split_arg("keys"), _split_arg("prefix")
+    try:
+        last_id = int(request.headers.get("Last-Event-ID", ""))
+    except ValueError:
+        last_id = None
+    conn = _StreamConn(keys, prefixes)
+
+    def snapshot():
+        with _state_lock:
+            _refresh_if_stale()
+            sub = _get_subscription(conn.keys, conn.prefixes)
+            if sub.body is None:
+                _encode_for(sub)
+            return _history.head(), sub.body
+
+    # registrar y leer el backlog/snapshot bajo _state_lock: ningún commit cae en medio
+    with _state_lock:
+        _refresh_if_stale()
+        head = _history.head()
+        backlog = _stream.subscribe(conn, last_id, head)
+    if backlog is False:
+        return jsonify({"error": "too many streams"}), 503
+
+    def gen():
+        sent = -1 if last_id is None else last_id
+        try:
+            yield "retry: 2000\n\n"
+            if backlog is None:
+                sent, body = snapshot()
+                yield _sse(sent, "snapshot", body)
+            else:
+                for eid, event, data in backlog:
+                    sent = eid
+                    yield _sse(eid, event, data)
+            while True:
+                try:
+                    item = conn.q.get(timeout=STREAM_HEARTBEAT_SEC)
+                except queue.Empty:
+                    yield ": ping\n\n"
+                    continue
+                if conn.lagged:
+                    conn.lagged = False
+                    while True:
+                        try:
+                            conn.q.get_nowait()
+                        except queue.Empty:
+                            break
+                    sent, body = snapshot()
+                    yield _sse(sent, "snapshot", body)
+                    continue
+                if item is None:
+                    continue
+                eid, event, data = item
+                if eid <= sent:
+                    continue  # ya incluido en el último snapshot
+                sent = eid
+                yield _sse(eid, event, data)
+        finally:
+            _stream.unsubscribe(conn)
+
+    return Response(gen(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+def _history_args():
+    """Lee key/from/to de la query; devuelve (keys, from, to) o una respuesta de error."""
+    key = (request.args.get("key") or "").strip().lower()
+    if key and key not in KEYS:
+        return None, (jsonify({"error": "unknown key"}), 400)
+    try:
+        t_to = int(request.args.get("to", _now_ts()))
+        t_from = int(request.args.get("from", max(0, t_to - 24 * 3600 * 1000)))
+    except ValueError:
+        return None, (jsonify({"error": "'from'/'to' must be ms timestamps"}), 400)
+    # localtime()/mktime() (tiempo ON por día) no admiten cualquier entero
+    if not (0 <= t_from <= HISTORY_TS_MAX and 0 <= t_to <= HISTORY_TS_MAX):
+        return None, (jsonify({"error": f"'from'/'to' out of range (0..{HISTORY_TS_MAX})"}), 400)
+    if t_from > t_to:
+        return None, (jsonify({"error": "'from' > 'to'"}), 400)
+    if not _history.ready():
+        # índice aún cargándose en segundo plano (arranque / reload del worker)
+        return None, (jsonify({"error": "history index loading"}), 503, {"Retry-After": "1"})
+    keys = [key] if key else list(KEYS)
+    return (keys, t_from, t_to), None
+
+
+@app.get("/api/history")
+def api_history():
+    """Transiciones en [from, to] (ms; por defecto últimas 24 h) de una clave o de todas."""
+    args, err = _history_args()
+    if err:
+        return err
+    keys, t_from, t_to = args
+    try:
+        limit = max(1, min(HISTORY_MAX_ITEMS, int(request.args.get("limit", 1000))))
+    except ValueError:
+        return jsonify({"error": "'limit' must be an integer"}), 400
+    out = {}
+    for k in keys:
+        before, items = _history.range(k, t_from, t_to, limit)
+        out[k] = {"value_before": before, "items": items, "truncated": len(items) >= limit}
+    return jsonify({"from": t_from, "to": t_to, "keys": out})
+
+
+@app.get("/api/history/ontime")
+def api_history_ontime():
+    """Tiempo ON (ms) por clave y por día local del servidor en [from, to)."""
+    args, err = _history_args()
+    if err:
+        return err
+    keys, t_from, t_to = args
+    if t_to - t_from > 366 * 24 * 3600 * 1000:
+        return jsonify({"error": "range too large (max 366 days)"}), 400
+    out = {k: [{"day": d, "on_ms": ms} for d, ms in _history.on_time_per_day(k, t_from, t_to)]
+           for k in keys}
+    return jsonify({"from": t_from, "to": t_to, "keys": out})
+
+
 if __name__ == "__main__":
     # Solo para desarrollo local manual (en producción lo lanzas con systemd/gunicorn)
     app.run(host="0.0.0.0", port=5000, debug=False)